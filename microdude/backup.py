@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude resumable sequence backup"""
+
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_EXTENSION = '.part'
+TMP_EXTENSION = '.tmp'
+SEQUENCES = 8
+OFFSETS = [0, 0x20]
+# Older journals might hold sequences that have been edited since
+MAX_JOURNAL_AGE = 3600
+
+
+class SequenceBackup(object):
+    """Backup of all the sequences to a .mbseq file that can be resumed after a failure.
+
+    Every fragment is appended to a journal next to the output file as soon as it is received.
+    Running a backup again for the same file, device and firmware version within MAX_JOURNAL_AGE
+    only requests the missing fragments. The output file is written atomically once all the
+    fragments are available.
+    """
+
+    def __init__(self, connector, filename, device=''):
+        self.connector = connector
+        self.filename = filename
+        self.device = device
+        self.journal = filename + JOURNAL_EXTENSION
+        self.fragments = {}
+        self.start = None
+
+    def get_header(self):
+        return '{:s}\t{:s}\t{:f}\n'.format(
+            self.device, str(self.connector.sw_version), self.start)
+
+    def load_journal(self):
+        self.fragments = {}
+        self.start = time.time()
+        try:
+            with open(self.journal, 'r') as journal:
+                try:
+                    device, version, start = journal.readline().rstrip(
+                        '\n').split('\t')
+                    start = float(start)
+                except ValueError:
+                    logger.debug('Bad journal header. Discarding...')
+                    return False
+                if device != self.device or version != str(self.connector.sw_version):
+                    logger.debug('Journal belongs to another device. Discarding...')
+                    return False
+                if not 0 <= self.start - start <= MAX_JOURNAL_AGE:
+                    logger.debug('Journal is too old. Discarding...')
+                    return False
+                self.start = start
+                for line in journal:
+                    # A line without the trailing newline was not completely written
+                    if not line.endswith('\n'):
+                        break
+                    try:
+                        seq_id, offset, data = line.split()
+                        self.fragments[(int(seq_id), int(offset))] = list(
+                            bytes.fromhex(data))
+                    except ValueError:
+                        break
+        except FileNotFoundError:
+            return False
+        logger.debug('Resuming backup with %d fragments...',
+                     len(self.fragments))
+        return True
+
+    def run(self):
+        """Receive the missing fragments and write the output file. ConnectorError is raised on failure."""
+        self.load_journal()
+        # The journal is rewritten to drop any partially written line
+        with open(self.journal, 'w') as journal:
+            journal.write(self.get_header())
+            for key, fragment in self.fragments.items():
+                self.write_fragment(journal, key, fragment)
+            for seq_id in range(SEQUENCES):
+                for offset in OFFSETS:
+                    if (seq_id, offset) in self.fragments:
+                        continue
+                    fragment = self.connector.get_sequence_fragment(
+                        seq_id, offset)
+                    self.fragments[(seq_id, offset)] = fragment
+                    self.write_fragment(journal, (seq_id, offset), fragment)
+        self.finish()
+
+    def write_fragment(self, journal, key, fragment):
+        journal.write('{:d} {:d} {:s}\n'.format(
+            key[0], key[1], bytes(fragment).hex()))
+        journal.flush()
+
+    def finish(self):
+        sequences = []
+        for seq_id in range(SEQUENCES):
+            sequence = []
+            for offset in OFFSETS:
+                sequence.extend(self.fragments[(seq_id, offset)])
+            sequences.append(
+                self.connector.get_sequence_string(seq_id, sequence))
+        tmp = self.filename + TMP_EXTENSION
+        with open(tmp, 'w') as output_file:
+            output_file.write('\r\n'.join(sequences))
+            output_file.flush()
+            os.fsync(output_file.fileno())
+        os.replace(tmp, self.filename)
+        os.remove(self.journal)
+        logger.debug('Backup written to %s.', self.filename)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude wheels calibration"""
+
+from microdude import connector
+from microdude.connector import ConnectorError
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+IDLE = 'idle'
+PB_CENTER = 'pb_center'
+BOTH_BOTTOM = 'both_bottom'
+BOTH_TOP = 'both_top'
+END = 'end'
+DONE = 'done'
+FAILED = 'failed'
+
+# Steps that need the user to move the wheels before them
+USER_STEPS = [PB_CENTER, BOTH_BOTTOM, BOTH_TOP]
+
+STEP_PARAMS = {
+    PB_CENTER: connector.CALIB_PB_CENTER,
+    BOTH_BOTTOM: connector.CALIB_BOTH_BOTTOM,
+    BOTH_TOP: connector.CALIB_BOTH_TOP,
+    END: connector.CALIB_END
+}
+
+END_DELAY = 1
+RETRY_DELAY = 0.2
+WRITE_RETRIES = 3
+# Every confirmation poll blocks for up to CONFIRM_RETRIES receive retries
+CONFIRM_RETRIES = 5
+CONFIRM_POLLS = 20
+
+
+def schedule_now(delay, callback):
+    """Default blocking scheduler for headless use."""
+    time.sleep(delay)
+    callback()
+
+
+class Calibration(object):
+    """Calibration state machine.
+
+    Every step writes its parameter and confirms the MicroBrute processed it with a round trip,
+    writing it again after RETRY_DELAY on failure. Writes, confirmation polls and delays are run through
+    schedule(delay, callback) so that a GUI can use its main loop timers. As every poll waits for a short
+    time only, the main loop is never blocked for long. listener is called with every new state.
+    """
+
+    def __init__(self, conn, schedule=schedule_now, listener=None):
+        self.connector = conn
+        self.schedule = schedule
+        self.listener = listener
+        self.state = IDLE
+        self.attempts = 0
+        self.polls = 0
+
+    def set_state(self, state):
+        logger.debug('Calibration state: %s', state)
+        self.state = state
+        if self.listener:
+            self.listener(state)
+
+    def step(self, state):
+        """Move to the given step and write it as soon as the scheduler allows."""
+        self.attempts = 0
+        self.set_state(state)
+        self.schedule(0, lambda: self.write(state))
+
+    def write(self, state):
+        # The user might have moved to another step meanwhile
+        if self.state != state:
+            return
+        try:
+            self.connector.set_parameter(STEP_PARAMS[state], 0)
+        except ConnectorError as e:
+            self.retry(state, e)
+            return
+        self.polls = 0
+        self.schedule(0, lambda: self.confirm(state))
+
+    def confirm(self, state):
+        if self.state != state:
+            return
+        try:
+            self.connector.ping(CONFIRM_RETRIES)
+        except ConnectorError as e:
+            self.polls += 1
+            if self.polls < CONFIRM_POLLS and self.connector.connected():
+                self.schedule(0, lambda: self.confirm(state))
+            else:
+                self.retry(state, e)
+            return
+        logger.debug('Calibration step %s confirmed', state)
+        if state == BOTH_TOP:
+            self.schedule(END_DELAY, lambda: self.step(END))
+        elif state == END:
+            self.set_state(DONE)
+
+    def retry(self, state, e):
+        self.attempts += 1
+        logger.warning('Calibration step %s failed (attempt %d): %s',
+                       state, self.attempts, str(e))
+        if self.attempts < WRITE_RETRIES and self.connector.connected():
+            self.schedule(RETRY_DELAY, lambda: self.write(state))
+        else:
+            self.set_state(FAILED)
+
+
+def calibrate_all(connectors, wait=lambda state: None):
+    """Calibrate several MicroBrutes in parallel blocking until done and return which ones finished.
+
+    wait is called before every user step to let the user move the wheels of all the units.
+    """
+    calibrations = [Calibration(c) for c in connectors]
+    for state in USER_STEPS:
+        wait(state)
+        threads = []
+        for calibration in calibrations:
+            if calibration.state != FAILED:
+                thread = threading.Thread(
+                    target=calibration.step, args=(state,))
+                thread.start()
+                threads.append(thread)
+        for thread in threads:
+            thread.join()
+    return [c.state == DONE for c in calibrations]
+
+
+def calibrate(conn, wait=lambda state: None):
+    """Calibrate a MicroBrute blocking until done and return True if it finished."""
+    return calibrate_all([conn], wait)[0]
@@ -20,20 +20,49 @@
 """MicroDude connector"""
 
 import mido
+import os
 import time
 import logging
+import collections
 import importlib.util
 from mido import Message
 
 logger = logging.getLogger(__name__)
 
-spec = importlib.util.find_spec('rtmidi')
-if spec:
-    backend = 'mido.backends.rtmidi'
-else:
-    backend = 'mido.backends.portmidi'
+BACKEND_ENV = 'MICRODUDE_BACKEND'
+RTMIDI_BACKEND = 'mido.backends.rtmidi'
+PORTMIDI_BACKEND = 'mido.backends.portmidi'
+BACKENDS = [RTMIDI_BACKEND, PORTMIDI_BACKEND]
 
-mido.set_backend(backend)
+
+def get_default_backend():
+    spec = importlib.util.find_spec('rtmidi')
+    if spec:
+        return RTMIDI_BACKEND
+    else:
+        return PORTMIDI_BACKEND
+
+
+def set_backend(name=None):
+    """Set the mido backend.
+
+    The MICRODUDE_BACKEND environment variable takes precedence over name and
+    rtmidi, if available, or portmidi are used if none is given or it can not be loaded.
+    """
+    backend = os.environ.get(BACKEND_ENV) or name
+    if backend:
+        try:
+            mido.set_backend(backend, load=True)
+        except (ImportError, OSError) as e:
+            logger.error('Backend %s could not be loaded: "%s"',
+                         backend, str(e))
+            backend = None
+    if not backend:
+        mido.set_backend(get_default_backend())
+    logger.debug('Mido backend: %s', str(mido.backend))
+
+
+set_backend()
 
 INQUIRY_REQ = [0x7E, 0x7F, 0x6, 0x1]
 INQUIRY_RES_WO_VERSION = [0x7E, 0x1, 0x6,
@@ -59,6 +88,14 @@ CALIB_BOTH_BOTTOM = 0x22
 CALIB_BOTH_TOP = 0x23
 CALIB_END = 0x24
 
+PARAMETERS = [RX_CHANNEL, TX_CHANNEL, RETRIGGERING, LFO_KEY_RETRIGGER, PLAY_ON,
+              NOTE_PRIORITY, ENVELOPE_LEGATO, VEL_RESPONSE, NEXT_SEQUENCE,
+              BEND_RANGE, STEP_LENGTH, GATE_LENGTH, STEP_ON, SYNC]
+
+SEQUENCES = 8
+FRAGMENT_OFFSETS = [0, 0x20]
+FRAGMENT_LENGTH = 0x20
+
 CTL_RX_CHANNEL = 102
 CTL_TX_CHANNEL = 103
 CTL_NOTE_PRIORITY = 111
@@ -155,11 +192,20 @@ PARAM_CTL_MAPPING = {
     }
 }
 
-RECEIVE_RETRIES = 50
-RETRY_SLEEP_TIME = 0.1
+RECEIVE_RETRIES = 500
+RETRY_SLEEP_TIME = 0.01
+RESUME_RETRIES = 20
+VERIFY_ATTEMPTS = 3
+PIPELINE_DEPTH = 8
+TRACE_SIZE = 64
+TX = 'tx'
+RX = 'rx'
 
 SEQ_FILE_ERROR = 'Error in sequences file'
 
+CONFIRMED = 'confirmed'
+FAILED = 'failed'
+
 
 def get_ports():
     filtered = []
@@ -168,14 +214,29 @@ def get_ports():
             filtered.append(p)
     return filtered
 
+def get_steps(values):
+    """Return the values of a fragment up to the end of the sequence."""
+    return values[:values.index(0)] if 0 in values else values
+
+
 class Connector(object):
     """MicroDude connector"""
 
-    def __init__(self):
+    def __init__(self, port_factory=None, trace_size=0):
         logger.debug('Initializing...')
+        self.port_factory = port_factory
+        self.trace = collections.deque(
+            maxlen=trace_size) if trace_size else None
         self.port = None
+        self.device = None
         self.seq = 0
         self.sw_version = None
+        self.channel = None
+        # Firmware version and MIDI channel of the last session at every port
+        self.sessions = {}
+        # Last values read or written. MIDI controllers only change the ones in use.
+        self.values = {}
+        self.stored_values = {}
 
     def seq_inc(self):
         self.seq += 1
@@ -195,11 +256,39 @@ class Connector(object):
                 logger.error('IOError while disconnecting')
             self.port = None
 
+    def resume(self, device):
+        """Reuse the open port if the MicroBrute still answers or connect again otherwise.
+
+        Return True if the session was resumed without reconnecting.
+        """
+        if self.port and self.device == device:
+            try:
+                self.drain()
+                self.ping(RESUME_RETRIES)
+                logger.debug('Session resumed')
+                return True
+            except ConnectorError:
+                logger.debug('Session could not be resumed')
+        self.disconnect()
+        self.connect(device)
+        return False
+
+    def drain(self):
+        """Discard any stale message in the port."""
+        try:
+            for msg in self.port.iter_pending():
+                logger.debug('Discarding message %s', msg)
+        except IOError:
+            self.fail()
+
     def connect(self, device):
         """Connect to the MicroBrute."""
         logger.debug('Connecting to %s...', device)
         try:
-            self.port = mido.open_ioport(device)
+            # The backend might have changed since this object was created
+            factory = self.port_factory or mido.open_ioport
+            self.port = factory(device)
+            self.device = device
             logger.debug('Mido backend: %s', str(mido.backend))
             logger.debug('Handshaking...')
             self.tx_message(INQUIRY_REQ)
@@ -207,7 +296,19 @@ class Connector(object):
             if response[0:11] == INQUIRY_RES_WO_VERSION:
                 self.sw_version = '.'.join([str(i) for i in response[11:15]])
                 logger.debug('Handshake ok. Version %s.', self.sw_version)
-                self.set_channel(self.get_parameter(RX_CHANNEL))
+                version, channel = self.sessions.get(device, (None, None))
+                if version == self.sw_version:
+                    # The same unit is back so the channel does not need to be read again
+                    self.channel = channel
+                else:
+                    if version:
+                        logger.info('Device at %s changed from version %s to %s',
+                                    device, version, self.sw_version)
+                    # The channel is read when needed as set_ui reads it anyway
+                    self.channel = None
+                self.sessions[device] = (self.sw_version, self.channel)
+                self.values = {}
+                self.stored_values = {}
             else:
                 logger.debug('Bad handshake. Disconnecting...')
                 self.disconnect()
@@ -217,6 +318,8 @@ class Connector(object):
 
     def set_channel(self, channel):
         self.channel = channel if channel < 16 else 0
+        if self.device in self.sessions:
+            self.sessions[self.device] = (self.sw_version, self.channel)
 
     def set_sequence(self, sequence):
         """Set the sequence in Arturia's format in the MicroBrute."""
@@ -224,6 +327,47 @@ class Connector(object):
         for msg in msgs:
             self.tx_message(msg)
 
+    def set_sequences(self, sequences, verify=False):
+        """Set the sequences in Arturia's format in the MicroBrute.
+
+        If verify is True, the sequences are read back and the fragments that differ are sent again.
+        The verification summary is returned in that case.
+        """
+        expected = {}
+        for sequence in sequences:
+            for msg in self.create_set_sequence_messages(sequence):
+                self.tx_message(msg)
+                expected[(msg[8], msg[9])] = msg[11:43]
+        if verify:
+            return self.verify_sequence_fragments(expected)
+
+    def set_sequence_fragments(self, fragments, verify=False):
+        """Set the fragments given as a dictionary from (seq_id, offset) to values. See set_sequences for verify."""
+        for (seq_id, offset), values in fragments.items():
+            self.set_sequence_fragment(seq_id, offset, values)
+        if verify:
+            return self.verify_sequence_fragments(fragments)
+
+    def verify_sequence_fragments(self, expected):
+        """Read back the fragments in a pipelined fashion, send again the ones that differ and return a summary.
+
+        The summary is a dictionary with the CONFIRMED and FAILED (seq_id, offset) pairs.
+        """
+        pending = dict(expected)
+        confirmed = []
+        for attempt in range(VERIFY_ATTEMPTS):
+            keys = list(pending)
+            for key, values in zip(keys, self.get_sequence_fragments(keys)):
+                if get_steps(values) == get_steps(pending[key]):
+                    confirmed.append(key)
+                    del pending[key]
+            if not pending or attempt == VERIFY_ATTEMPTS - 1:
+                break
+            logger.debug('Sending %d fragments again...', len(pending))
+            for (seq_id, offset), values in pending.items():
+                self.set_sequence_fragment(seq_id, offset, values)
+        return {CONFIRMED: confirmed, FAILED: list(pending)}
+
     def get_sequence(self, seq_id):
         """Return the sequence in Arturia's format set in the MicroBrute for the given seq_id."""
         sequence = []
@@ -242,10 +386,27 @@ class Connector(object):
     def get_sequence_fragment(self, seq_id, offset):
         request = self.create_get_sequence_message(seq_id, offset)
         self.tx_message(request)
-        response = self.rx_message()
+        self.seq_inc()
+        response = self.rx_message(request=request)
+        self.check_sequence_response(response, request[5], seq_id, offset)
+        return response[11:43]
 
-        # Checking some bytes and getting the value
-        if response[5] != self.seq:
+    def get_sequence_fragments(self, fragments):
+        """Return the fragments for the given (seq_id, offset) pairs requesting them in a pipelined fashion."""
+        requests = []
+        for seq_id, offset in fragments:
+            requests.append(self.create_get_sequence_message(seq_id, offset))
+            self.seq_inc()
+        responses = self.get_responses(requests)
+        values = []
+        for (seq_id, offset), request, response in zip(fragments, requests, responses):
+            self.check_sequence_response(response, request[5], seq_id, offset)
+            values.append(response[11:43])
+        return values
+
+    def check_sequence_response(self, response, seq, seq_id, offset):
+        # Checking some bytes
+        if response[5] != seq:
             logger.warn('Bad sequence number byte')
         if response[6] != 0x23:
             logger.warn('Bad client byte')
@@ -258,25 +419,73 @@ class Connector(object):
         if response[10] != 0x20:
             logger.warn('Bad length byte')
 
-        self.seq_inc()
-        return response[11:43]
+    def set_sequence_fragment(self, seq_id, offset, values):
+        """Set a fragment given as the values returned by get_sequence_fragment."""
+        self.tx_message(self.create_set_sequence_message(
+            seq_id, offset, get_steps(values)))
 
-    def get_parameter(self, param):
+    def get_parameter(self, param, retries=RECEIVE_RETRIES):
         request = self.create_get_parameter_message(param)
         self.tx_message(request)
-        response = self.rx_message()
+        self.seq_inc()
+        response = self.rx_message(retries, request)
+        self.check_parameter_response(response, request[5], param)
+        if param == RX_CHANNEL:
+            self.set_channel(response[8])
+        self.values[param] = response[8]
+        self.stored_values[param] = response[8]
+        return response[8]
+
+    def ping(self, retries=RECEIVE_RETRIES):
+        """Wait until the MicroBrute has processed all the messages sent before by doing a round trip."""
+        self.get_parameter(RX_CHANNEL, retries)
 
-        # Checking some bytes and getting the value
-        if response[5] != self.seq:
+    def get_parameters(self, params):
+        """Return a dictionary with the values of the given parameters requesting them in a pipelined fashion."""
+        requests = []
+        for param in params:
+            requests.append(self.create_get_parameter_message(param))
+            self.seq_inc()
+        responses = self.get_responses(requests)
+        values = {}
+        for param, request, response in zip(params, requests, responses):
+            self.check_parameter_response(response, request[5], param)
+            values[param] = response[8]
+        if RX_CHANNEL in values:
+            self.set_channel(values[RX_CHANNEL])
+        self.values.update(values)
+        self.stored_values.update(values)
+        return values
+
+    def check_parameter_response(self, response, seq, param):
+        # Checking some bytes
+        if response[5] != seq:
             logger.warn('Bad sequence number byte')
         if response[6] != 1:
             logger.warn('Bad client byte')
         if response[7] != param:
             logger.warn('Bad parameter byte')
 
-        self.seq_inc()
-
-        return response[8]
+    def get_responses(self, requests):
+        """Send the requests keeping up to PIPELINE_DEPTH of them in flight and return the responses in order."""
+        responses = []
+        sent = 0
+        while len(responses) < len(requests):
+            while sent < len(requests) and sent - len(responses) < PIPELINE_DEPTH:
+                self.tx_message(requests[sent])
+                sent += 1
+            responses.append(self.rx_message(request=requests[len(responses)]))
+        return responses
+
+    def is_response(self, request, response):
+        """Tell if the response answers the request as a late response to a timed out request might arrive."""
+        if len(response) < 8 or response[5] != request[5]:
+            return False
+        if request[6] == 0:
+            return response[7] == request[7] - 1
+        if request[6] == 0x03:
+            return len(response) > 9 and response[8:10] == request[8:10]
+        return True
 
     def create_get_parameter_message(self, param):
         """Return an array representing the SysEx message to get the given parameter in Arturia's format."""
@@ -287,24 +496,83 @@ class Connector(object):
         message.append(param + 1)
         return message
 
-    def set_parameter(self, param, value, persistent=True):
+    def set_parameter(self, param, value, persistent=True, verify=False):
+        if persistent and verify:
+            summary = self.set_parameters({param: value}, True)
+            return param in summary[CONFIRMED]
         if persistent:
             msg = self.create_set_parameter_message(param, value)
             self.tx_message(msg)
             self.seq_inc()
+            self.stored_values[param] = value
         else:
-            msgs = self.get_ctl_msgs(param, value)
-            try:
-                for m in msgs:
-                    logger.debug('Sending message %s', str(m))
-                    self.port.send(m)
-            except IOError:
-                self.disconnect()
-                raise ConnectorError()
+            if self.channel is None:
+                self.get_parameter(RX_CHANNEL)
+            self.send_ctl_msgs(self.get_ctl_msgs(param, value))
+        self.values[param] = value
         if param == RX_CHANNEL:
             self.set_channel(value)
         return True
 
+    def send_ctl_msgs(self, msgs):
+        try:
+            for m in msgs:
+                logger.debug('Sending message %s', m)
+                if self.trace is not None:
+                    self.trace.append((time.monotonic(), TX, m.bytes()))
+                self.port.send(m)
+        except IOError:
+            self.fail()
+
+    def set_parameters(self, values, verify=False, persistent=True):
+        """Set the parameter values given as a dictionary with SysEx messages or MIDI controllers if not persistent.
+
+        If verify is True, the parameters are read back and the ones that differ are sent again.
+        The verification summary is returned in that case. MIDI controllers can not be verified.
+        """
+        if not persistent:
+            if self.channel is None:
+                self.get_parameter(RX_CHANNEL)
+            msgs = []
+            # The channel changes after RX_CHANNEL so it goes last
+            for param in sorted(values, key=lambda p: p == RX_CHANNEL):
+                msgs.extend(self.get_ctl_msgs(param, values[param]))
+            self.send_ctl_msgs(msgs)
+            self.values.update(values)
+            if RX_CHANNEL in values:
+                self.set_channel(values[RX_CHANNEL])
+            return
+        for param, value in values.items():
+            self.tx_message(self.create_set_parameter_message(param, value))
+            self.seq_inc()
+        self.values.update(values)
+        self.stored_values.update(values)
+        if RX_CHANNEL in values:
+            self.set_channel(values[RX_CHANNEL])
+        if verify:
+            return self.verify_parameters(values)
+
+    def verify_parameters(self, expected):
+        """Read back the parameters in a pipelined fashion, send again the ones that differ and return a summary.
+
+        The summary is a dictionary with the CONFIRMED and FAILED parameters.
+        """
+        pending = dict(expected)
+        confirmed = []
+        for attempt in range(VERIFY_ATTEMPTS):
+            actual = self.get_parameters(list(pending))
+            for param, value in actual.items():
+                if value == pending[param]:
+                    confirmed.append(param)
+                    del pending[param]
+            if not pending or attempt == VERIFY_ATTEMPTS - 1:
+                break
+            logger.debug('Sending %d parameters again...', len(pending))
+            for param, value in pending.items():
+                self.tx_message(self.create_set_parameter_message(param, value))
+                self.seq_inc()
+        return {CONFIRMED: confirmed, FAILED: list(pending)}
+
     def create_set_parameter_message(self, param, value):
         """Return an array representing the SysEx message to set the given parameter and value in Arturia's format."""
         msg = []
@@ -317,30 +585,55 @@ class Connector(object):
 
     def tx_message(self, data):
         msg = mido.Message('sysex', data=data)
-        logger.debug('Sending message %s...', self.get_hex_data(data))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Sending message %s...', self.get_hex_data(data))
+        if self.trace is not None:
+            self.trace.append((time.monotonic(), TX, data))
         try:
             self.port.send(msg)
         except IOError:
-            self.disconnect()
-            raise ConnectorError()
+            self.fail()
 
-    def rx_message(self):
+    def rx_message(self, retries=RECEIVE_RETRIES, request=None):
+        """Return the next SysEx message received or, if a request is given, the response to it."""
         try:
-            for i in range(0, RECEIVE_RETRIES):
+            for i in range(0, retries):
                 for msg in self.port.iter_pending():
                     if msg.type == 'sysex':
-                        logger.debug('Receiving message %s...',
-                            self.get_hex_data(msg.data))
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug('Receiving message %s...',
+                                self.get_hex_data(msg.data))
+                        if self.trace is not None:
+                            self.trace.append((time.monotonic(), RX, msg.data))
                         data_array = []
                         data_array.extend(msg.data)
+                        if request and not self.is_response(request, data_array):
+                            logger.debug('Discarding late message')
+                            continue
                         return data_array
                 time.sleep(RETRY_SLEEP_TIME)
         except IOError:
-            self.disconnect()
-            raise ConnectorError()
+            self.fail()
+        # After a timeout the port is still usable so it is kept open to resume the session.
+        # The trace is not dumped as callers might retry. It is up to the one reporting the error.
+        raise ConnectorError()
+
+    def fail(self):
+        """Dump the trace, disconnect and raise a ConnectorError."""
+        self.dump_trace()
         self.disconnect()
         raise ConnectorError()
 
+    def dump_trace(self):
+        """Log the frames in the trace with their time relative to the last one."""
+        if not self.trace:
+            return
+        last = self.trace[-1][0]
+        logger.error('Last %d frames:', len(self.trace))
+        for timestamp, direction, data in self.trace:
+            logger.error('%+.3f s %s %s', timestamp - last,
+                         direction, self.get_hex_data(data))
+
     def get_hex_data(self, data):
         return ' '.join([f'{i:02x}' for i in data])
 
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude device discovery"""
+
+from microdude import connector
+import mido
+import re
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DISCOVERY_TIMEOUT = 0.5
+POLL_TIME = 0.001
+
+# ALSA appends the client and port numbers, which depend on the USB enumeration order
+ALSA_NUMBERS = re.compile(r'\s+\d+:\d+$')
+
+
+def get_port_key(port):
+    """Return the port name without the volatile ALSA client and port numbers."""
+    return ALSA_NUMBERS.sub('', port)
+
+
+def get_sort_key(port):
+    """Return a key to sort the ports by their numbers as ALSA assigns them in order."""
+    return [int(t) if t.isdigit() else t for t in re.split(r'(\d+)', port)]
+
+
+def get_version(response):
+    """Return the firmware version in an inquiry reply or None if it is not from a MicroBrute."""
+    if response[0:11] != connector.INQUIRY_RES_WO_VERSION or len(response) < 15:
+        return None
+    return '.'.join([str(i) for i in response[11:15]])
+
+
+class Discovery(object):
+    """Find the MicroBrutes sending an inquiry request to all the candidate ports at the same time.
+
+    A MicroBrute does not report a serial number so a unit is identified by the port name without the
+    ALSA numbers and, if several units share it, by their order. ports maps these identities to the
+    port names of the last scan and versions to their firmware versions.
+    """
+
+    def __init__(self, port_factory=None, get_names=connector.get_ports):
+        self.port_factory = port_factory
+        self.get_names = get_names
+        self.ports = {}
+        self.versions = {}
+
+    def scan(self, timeout=DISCOVERY_TIMEOUT, known=None):
+        """Discover the connected units and return the map from their identities to their ports.
+
+        known maps the ports already open, like the one used by a Connector, to their versions.
+        These are not opened again.
+        """
+        known = known or {}
+        names = sorted(self.get_names(), key=get_sort_key)
+        logger.debug('Scanning %d ports...', len(names))
+        versions = self.inquire(
+            [name for name in names if name not in known], timeout)
+        for name in names:
+            if name in known:
+                versions[name] = known[name]
+        self.ports = {}
+        self.versions = {}
+        ordinals = {}
+        for name in names:
+            if name not in versions:
+                continue
+            key = get_port_key(name)
+            ordinals[key] = ordinals.get(key, 0) + 1
+            identity = key if ordinals[key] == 1 else '{:s} #{:d}'.format(
+                key, ordinals[key])
+            logger.debug('Found unit %s at %s with version %s',
+                         identity, name, versions[name])
+            self.ports[identity] = name
+            self.versions[identity] = versions[name]
+        return self.ports
+
+    def inquire(self, names, timeout):
+        """Return the firmware version of every port answering before the deadline."""
+        factory = self.port_factory or mido.open_ioport
+        ports = {}
+        for name in names:
+            try:
+                ports[name] = factory(name)
+            except IOError as e:
+                logger.error('Port %s could not be opened: "%s"',
+                             name, str(e))
+        msg = mido.Message('sysex', data=connector.INQUIRY_REQ)
+        versions = {}
+        try:
+            for name, port in list(ports.items()):
+                try:
+                    port.send(msg)
+                except IOError:
+                    del ports[name]
+            deadline = time.monotonic() + timeout
+            waiting = set(ports)
+            while waiting and time.monotonic() < deadline:
+                for name in list(waiting):
+                    try:
+                        replies = list(ports[name].iter_pending())
+                    except IOError:
+                        waiting.discard(name)
+                        continue
+                    for reply in replies:
+                        if reply.type != 'sysex':
+                            continue
+                        version = get_version(list(reply.data))
+                        if version:
+                            versions[name] = version
+                            waiting.discard(name)
+                            break
+                if waiting:
+                    time.sleep(POLL_TIME)
+        finally:
+            for port in ports.values():
+                port.close()
+        return versions
+
+    def get_ports(self):
+        """Return the cached map scanning only if there is none."""
+        if not self.ports:
+            self.scan()
+        return self.ports
+
+    def get_port(self, device):
+        """Return the port of the unit with the given identity or port name from the cached map."""
+        ports = self.get_ports()
+        if device in ports:
+            return ports[device]
+        if device in ports.values():
+            return device
+        return None
+
+    def get_identity(self, port):
+        """Return the identity of the unit at the given port from the cached map."""
+        for identity, name in self.get_ports().items():
+            if name == port:
+                return identity
+        return None
@@ -19,7 +19,6 @@
 
 """MicroDude user interface"""
 
-import time
 from gettext import gettext as _
 import gettext
 import locale
@@ -28,6 +27,12 @@ import sys
 from microdude import utils
 from microdude.connector import ConnectorError
 from microdude import connector
+from microdude import calibration
+from microdude import discovery
+from microdude.profiler import Profiler
+from microdude.profiler import HEARTBEAT_INTERVAL
+from microdude.backup import SequenceBackup
+from microdude.snapshots import SnapshotMemory
 import pkg_resources
 import logging
 import gi
@@ -46,14 +51,19 @@ EXTENSION = '.mbseq'
 DEF_FILENAME = _('sequences') + EXTENSION
 
 log_level = logging.ERROR
+profiler = None
+
+# Connector calls reached from the editor, the backup and the calibration that block the main loop
+PROFILED_CALLS = ['connect', 'resume', 'drain', 'disconnect', 'ping', 'get_parameters',
+                  'set_parameter', 'get_sequence_fragment', 'set_sequence']
 
 
 def print_help():
-    print('Usage: {:s} [-v]'.format(utils.APP_NAME))
+    print('Usage: {:s} [-v] [-p]'.format(utils.APP_NAME))
 
 
 try:
-    opts, args = getopt.getopt(sys.argv[1:], "hv")
+    opts, args = getopt.getopt(sys.argv[1:], "hvp")
 except getopt.GetoptError:
     print_help()
     sys.exit(1)
@@ -63,6 +73,8 @@ for opt, arg in opts:
         sys.exit()
     elif opt == '-v':
         log_level = logging.DEBUG
+    elif opt == '-p':
+        profiler = Profiler()
 
 logging.basicConfig(level=log_level)
 logger = logging.getLogger(__name__)
@@ -73,20 +85,149 @@ builder.add_from_file(glade_file)
 utils.create_config()
 
 
+COMBO = 'combo'
+SWITCH = 'switch'
+SPIN = 'spin'
+
+# Column of the combo models holding the parameter value
+VALUE_COLUMN = 1
+
+PARAMETER_WIDGETS = [
+    (connector.RX_CHANNEL, 'rx_channel', COMBO),
+    (connector.TX_CHANNEL, 'tx_channel', COMBO),
+    (connector.RETRIGGERING, 'retriggering', COMBO),
+    (connector.LFO_KEY_RETRIGGER, 'lfo_key_retrigger', SWITCH),
+    (connector.PLAY_ON, 'play', COMBO),
+    (connector.NOTE_PRIORITY, 'note_priority', COMBO),
+    (connector.ENVELOPE_LEGATO, 'envelope_legato', SWITCH),
+    (connector.VEL_RESPONSE, 'vel_response', COMBO),
+    (connector.NEXT_SEQUENCE, 'next_sequence', COMBO),
+    (connector.BEND_RANGE, 'bend_range', SPIN),
+    (connector.STEP_LENGTH, 'step_length', COMBO),
+    (connector.GATE_LENGTH, 'gate_length', COMBO),
+    (connector.STEP_ON, 'step_on', COMBO),
+    (connector.SYNC, 'sync', COMBO)
+]
+
+
+class ParameterBinding(object):
+    """Link between a connector parameter and the widget showing it"""
+
+    def __init__(self, param, widget, kind):
+        self.param = param
+        self.widget = widget
+        self.kind = kind
+        self.value = None
+        self.handler_id = None
+        self.rows = {}
+        if kind == COMBO:
+            for row, item in enumerate(widget.get_model()):
+                self.rows[item[VALUE_COLUMN]] = row
+
+    def get_value(self):
+        if self.kind == COMBO:
+            return self.widget.get_model()[self.widget.get_active()][VALUE_COLUMN]
+        elif self.kind == SWITCH:
+            return int(self.widget.get_active())
+        else:
+            return self.widget.get_value_as_int()
+
+    def set_value(self, value):
+        if self.kind == COMBO:
+            row = self.rows.get(value)
+            if row is None:
+                logger.warning('Value %d not found for parameter %d',
+                               value, self.param)
+                return
+            self.widget.set_active(row)
+        elif self.kind == SWITCH:
+            self.widget.set_state(value)
+            self.widget.set_active(value)
+        else:
+            self.widget.set_value(value)
+        self.value = value
+
+
+class BindingRegistry(object):
+    """Parameter widgets indexed by parameter"""
+
+    def __init__(self):
+        self.bindings = {}
+
+    def add(self, param, widget, kind, handler):
+        """Add a widget calling handler with the parameter and its value when the user changes it."""
+        binding = ParameterBinding(param, widget, kind)
+        if kind == COMBO:
+            binding.handler_id = connect_signal(
+                widget, 'changed', lambda widget: self.changed(binding, handler))
+        elif kind == SWITCH:
+            binding.handler_id = connect_signal(
+                widget, 'state-set', lambda widget, state: self.changed(binding, handler, state))
+        else:
+            binding.handler_id = connect_signal(
+                widget, 'value-changed', lambda widget: self.changed(binding, handler))
+        self.bindings[param] = binding
+
+    def changed(self, binding, handler, state=None):
+        if state is None:
+            value = binding.get_value()
+        else:
+            value = int(state)
+            binding.widget.set_state(state)
+            binding.widget.set_active(state)
+        binding.value = value
+        handler(binding.param, value)
+
+    def apply(self, values):
+        """Show the given parameter values without emitting signals and only touching the widgets that change."""
+        for param, value in values.items():
+            binding = self.bindings.get(param)
+            if binding is None or binding.value == value:
+                continue
+            binding.widget.handler_block(binding.handler_id)
+            try:
+                binding.set_value(value)
+            finally:
+                binding.widget.handler_unblock(binding.handler_id)
+
+
+def connect_signal(widget, signal, handler):
+    """Connect the handler to the signal timing it if profiling."""
+    if profiler:
+        name = '{:s}::{:s}'.format(Gtk.Buildable.get_name(widget), signal)
+        handler = profiler.wrap(name, handler)
+    return widget.connect(signal, handler)
+
+
+def schedule(delay, callback):
+    if profiler:
+        callback = profiler.wrap(
+            'timeout::' + callback.__qualname__, callback)
+    GLib.timeout_add(int(delay * 1000), callback)
+
+
 class CalibrationAssistant(object):
 
-    def __init__(self, connector):
-        self.connector = connector
+    PAGE_STEPS = {
+        2: calibration.PB_CENTER,
+        3: calibration.BOTH_BOTTOM,
+        4: calibration.BOTH_TOP
+    }
+
+    def __init__(self, connector, on_error):
+        self.calibration = calibration.Calibration(
+            connector, schedule, self.calibration_changed)
+        self.on_error = on_error
         self.calibration_assistant = builder.get_object(
             'calibration_assistant')
-        self.calibration_assistant.connect(
-            'close', lambda user_data: self.close())
-        self.calibration_assistant.connect(
-            'cancel', lambda user_data: self.cancel())
-        self.calibration_assistant.connect(
-            'escape', lambda user_data: self.cancel())
-        self.calibration_assistant.connect(
-            'prepare', lambda widget, user_data: self.prepare(user_data))
+        connect_signal(self.calibration_assistant,
+                       'close', lambda user_data: self.close())
+        connect_signal(self.calibration_assistant,
+                       'cancel', lambda user_data: self.cancel())
+        connect_signal(self.calibration_assistant,
+                       'escape', lambda user_data: self.cancel())
+        connect_signal(self.calibration_assistant,
+                       'prepare', lambda widget, user_data: self.prepare(user_data))
 
     def show(self):
         self.calibration_assistant.show()
@@ -96,14 +237,14 @@ class CalibrationAssistant(object):
 
     def prepare(self, user_data):
         page = self.calibration_assistant.get_current_page()
-        if page == 2:
-            self.connector.set_parameter(connector.CALIB_PB_CENTER, 0)
-        elif page == 3:
-            self.connector.set_parameter(connector.CALIB_BOTH_BOTTOM, 0)
-        elif page == 4:
-            self.connector.set_parameter(connector.CALIB_BOTH_TOP, 0)
-            time.sleep(1)
-            self.connector.set_parameter(connector.CALIB_END, 0)
+        step = self.PAGE_STEPS.get(page)
+        if step:
+            self.calibration.step(step)
+
+    def calibration_changed(self, state):
+        if state == calibration.FAILED:
+            self.calibration_assistant.hide()
+            self.on_error(ConnectorError())
 
     def cancel(self):
         self.calibration_assistant.hide()
@@ -113,83 +254,61 @@ class Editor(object):
     """MicroDude user interface"""
 
     def __init__(self):
-        self.connector = connector.Connector()
+        self.connector = connector.Connector(
+            trace_size=connector.TRACE_SIZE)
+        self.discovery = discovery.Discovery()
+        self.snapshots = SnapshotMemory(self.connector)
+        if profiler:
+            profiler.instrument(
+                self.connector, PROFILED_CALLS, 'Connector')
+            profiler.instrument(self.discovery, ['scan'], 'Discovery')
         self.config = utils.read_config()
+        connector.set_backend(self.config.get_device_value(utils.BACKEND))
 
     def init_ui(self):
         self.main_window = builder.get_object('main_window')
-        self.main_window.connect(
-            'delete-event', lambda widget, event: self.quit())
+        connect_signal(
+            self.main_window, 'delete-event', lambda widget, event: self.quit())
         self.main_window.set_position(Gtk.WindowPosition.CENTER)
         self.about_dialog = builder.get_object('about_dialog')
         self.about_dialog.set_version(version)
 
         self.save_button = builder.get_object('save_button')
-        self.save_button.connect('clicked', lambda widget: self.show_save())
+        connect_signal(self.save_button, 'clicked', lambda widget: self.show_save())
         self.open_button = builder.get_object('open_button')
-        self.open_button.connect('clicked', lambda widget: self.show_open())
+        connect_signal(self.open_button, 'clicked', lambda widget: self.show_open())
         self.about_button = builder.get_object('about_button')
-        self.about_button.connect('clicked', lambda widget: self.show_about())
+        connect_signal(self.about_button, 'clicked', lambda widget: self.show_about())
         self.calibrate_button = builder.get_object('calibrate_button')
-        self.calibrate_button.connect(
-            'clicked', lambda widget: self.calibration_assistant.show())
+        connect_signal(
+            self.calibrate_button, 'clicked', lambda widget: self.calibration_assistant.show())
 
         self.device_combo = builder.get_object('device_combo')
-        self.device_combo.connect('changed', lambda widget: self.set_device())
+        self.device_combo_handler = connect_signal(
+            self.device_combo, 'changed', lambda widget: self.set_device())
         self.device_liststore = builder.get_object('device_liststore')
         self.refresh_button = builder.get_object('refresh_button')
-        self.refresh_button.connect(
-            'clicked', lambda widget: self.load_devices(False))
+        connect_signal(
+            self.refresh_button, 'clicked', lambda widget: self.load_devices(False))
         self.persistent = builder.get_object('persistent_changes')
-        self.persistent.connect(
-            'state-set', lambda widget, state: self.set_persistent())
+        connect_signal(
+            self.persistent, 'state-set', lambda widget, state: self.set_persistent())
+        self.snapshot_combo = builder.get_object('snapshot_combo')
+        connect_signal(
+            self.snapshot_combo, 'changed', lambda widget: self.recall_snapshot())
+        self.snapshot_button = builder.get_object('snapshot_button')
+        connect_signal(
+            self.snapshot_button, 'clicked', lambda widget: self.store_snapshot())
 
         self.main_container = builder.get_object('main_container')
-        self.note_priority = builder.get_object('note_priority')
-        self.vel_response = builder.get_object('vel_response')
-        self.tx_channel = builder.get_object('tx_channel')
-        self.rx_channel = builder.get_object('rx_channel')
-        self.play = builder.get_object('play')
-        self.retriggering = builder.get_object('retriggering')
-        self.next_sequence = builder.get_object('next_sequence')
-        self.step_on = builder.get_object('step_on')
-        self.step_length = builder.get_object('step_length')
-        self.lfo_key_retrigger = builder.get_object('lfo_key_retrigger')
-        self.envelope_legato = builder.get_object('envelope_legato')
-        self.bend_range = builder.get_object('bend_range')
-        self.gate_length = builder.get_object('gate_length')
-        self.sync = builder.get_object('sync')
-        self.note_priority.connect('changed', lambda widget: self.set_parameter_from_combo(
-            connector.NOTE_PRIORITY, widget))
-        self.vel_response.connect('changed', lambda widget: self.set_parameter_from_combo(
-            connector.VEL_RESPONSE, widget))
-        self.tx_channel.connect('changed', lambda widget: self.set_parameter_from_combo(
-            connector.TX_CHANNEL, widget))
-        self.rx_channel.connect('changed', lambda widget: self.set_parameter_from_combo(
-            connector.RX_CHANNEL, widget))
-        self.play.connect('changed', lambda widget: self.set_parameter_from_combo(
-            connector.PLAY_ON, widget))
-        self.retriggering.connect('changed', lambda widget: self.set_parameter_from_combo(
-            connector.RETRIGGERING, widget))
-        self.next_sequence.connect('changed', lambda widget: self.set_parameter_from_combo(
-            connector.NEXT_SEQUENCE, widget))
-        self.step_on.connect('changed', lambda widget: self.set_parameter_from_combo(
-            connector.STEP_ON, widget))
-        self.step_length.connect('changed', lambda widget: self.set_parameter_from_combo(
-            connector.STEP_LENGTH, widget))
-        self.lfo_key_retrigger.connect(
-            'state-set', lambda widget, state: self.set_parameter_from_switch(connector.LFO_KEY_RETRIGGER, state, widget))
-        self.envelope_legato.connect(
-            'state-set', lambda widget, state: self.set_parameter_from_switch(connector.ENVELOPE_LEGATO, state, widget))
-        self.bend_range.connect(
-            'value-changed', lambda widget: self.set_parameter_from_spin(connector.BEND_RANGE, widget))
-        self.gate_length.connect('changed', lambda widget: self.set_parameter_from_combo(
-            connector.GATE_LENGTH, widget))
-        self.sync.connect('changed', lambda widget: self.set_parameter_from_combo(
-            connector.SYNC, widget))
+        self.bindings = BindingRegistry()
+        for param, name, kind in PARAMETER_WIDGETS:
+            self.bindings.add(param, builder.get_object(name), kind,
+                              self.set_parameter_from_interface)
         self.statusbar = builder.get_object('statusbar')
         self.context_id = self.statusbar.get_context_id(utils.APP_NAME)
-        self.calibration_assistant = CalibrationAssistant(self.connector)
+        self.calibration_assistant = CalibrationAssistant(
+            self.connector, self.calibration_failed)
 
         self.filter_mbseq = Gtk.FileFilter()
         self.filter_mbseq.set_name(_('MicroBrute sequence files'))
@@ -204,18 +323,37 @@ class Editor(object):
 
     def connect(self):
         device = self.config[utils.DEVICE]
-        self.connector.connect(device)
+        port = self.discovery.get_port(device)
+        if port:
+            try:
+                self.connector.resume(port)
+            except ConnectorError:
+                self.connector.disconnect()
+            if self.connector.connected():
+                return
+        self.connector.disconnect()
+        # The unit might be at another port after a USB re-enumeration
+        logger.debug('Unit {:s} not found at {:s}. Scanning...'.format(
+            device, str(port)))
+        self.discovery.scan()
+        new_port = self.discovery.get_port(device)
+        if new_port and new_port != port:
+            self.connector.resume(new_port)
 
     def ui_reconnect(self):
-        self.connector.disconnect()
         active = self.device_combo.get_active()
         if active > -1:
             self.connect()
+        else:
+            self.connector.disconnect()
         self.set_ui()
 
     def set_ui_config(self):
         self.load_devices(True)
-        persistent = self.config.get(utils.PERSISTENT)
+        self.set_persistent_ui()
+
+    def set_persistent_ui(self):
+        persistent = self.config.get_device_value(utils.PERSISTENT)
         self.persistent.set_state(persistent)
         self.persistent.set_active(persistent)
 
@@ -223,19 +361,44 @@ class Editor(object):
         self.load_devices(False)
 
     def load_devices(self, select):
-        self.device_liststore.clear()
-        i = 0
+        """Scan the units and select the configured one.
+
+        If select is True, the unit is connected. Otherwise, the connection is kept if the unit is still there.
+        """
+        device = self.config.get(utils.DEVICE)
+        known = {}
+        # The port in use is not opened again
+        if self.connector.connected():
+            known[self.connector.device] = self.connector.sw_version
+        units = sorted(self.discovery.scan(known=known).items())
         found = -1
-        for port in connector.get_ports():
-            logger.debug('Adding port {:s}...'.format(port))
-            self.device_liststore.append([port])
-            if self.config.get(utils.DEVICE) == port and select:
-                logger.debug('Port {:s} is active'.format(port))
-                found = i
-            i += 1
-        self.device_combo.set_active(found)
-        if select and self.device_combo.get_active() == -1:
+        # Clearing and filling the list would change the device otherwise
+        self.device_combo.handler_block(self.device_combo_handler)
+        try:
+            self.device_liststore.clear()
+            for i, (identity, port) in enumerate(units):
+                logger.debug(
+                    'Adding unit {:s} at {:s}...'.format(identity, port))
+                self.device_liststore.append([identity])
+                # Configurations from older versions use the port name
+                if port != identity and (device == port or port in self.config[utils.DEVICES]):
+                    if device == port:
+                        device = identity
+                    self.config.rename_device(port, identity)
+                if device == identity:
+                    logger.debug('Unit {:s} is active'.format(identity))
+                    found = i
+            self.device_combo.set_active(found)
+        finally:
+            self.device_combo.handler_unblock(self.device_combo_handler)
+        if found > -1:
+            if select:
+                self.set_device()
+        elif select:
             self.set_ui()
+        else:
+            # The unit in use is gone
+            self.set_device()
 
     def set_device(self):
         active = self.device_combo.get_active()
@@ -244,47 +407,21 @@ class Editor(object):
         else:
             device = ''
         self.config[utils.DEVICE] = device
+        self.set_persistent_ui()
+        # Every unit has its own backend
+        connector.set_backend(self.config.get_device_value(utils.BACKEND))
         self.ui_reconnect()
 
     def set_persistent(self):
-        self.config[utils.PERSISTENT] = self.persistent.get_active()
+        self.config.set_device_value(
+            utils.PERSISTENT, self.persistent.get_active())
 
     def set_ui(self):
         """Load the configuration from the MicroBrute and set the values in the interface."""
         if self.connector.connected():
             logger.debug('Loading status...')
-            self.configuring = True
-            value = self.connector.get_parameter(connector.RX_CHANNEL)
-            self.set_combo_value(self.rx_channel, value)
-            value = self.connector.get_parameter(connector.TX_CHANNEL)
-            self.set_combo_value(self.tx_channel, value)
-            value = self.connector.get_parameter(connector.RETRIGGERING)
-            self.set_combo_value(self.retriggering, value)
-            value = self.connector.get_parameter(connector.LFO_KEY_RETRIGGER)
-            self.lfo_key_retrigger.set_state(value)
-            self.lfo_key_retrigger.set_active(value)
-            value = self.connector.get_parameter(connector.PLAY_ON)
-            self.set_combo_value(self.play, value)
-            value = self.connector.get_parameter(connector.NOTE_PRIORITY)
-            self.set_combo_value(self.note_priority, value)
-            value = self.connector.get_parameter(connector.ENVELOPE_LEGATO)
-            self.envelope_legato.set_state(value)
-            self.envelope_legato.set_active(value)
-            value = self.connector.get_parameter(connector.VEL_RESPONSE)
-            self.set_combo_value(self.vel_response, value)
-            value = self.connector.get_parameter(connector.NEXT_SEQUENCE)
-            self.set_combo_value(self.next_sequence, value)
-            value = self.connector.get_parameter(connector.BEND_RANGE)
-            self.bend_range.set_value(value)
-            value = self.connector.get_parameter(connector.STEP_LENGTH)
-            self.set_combo_value(self.step_length, value)
-            value = self.connector.get_parameter(connector.GATE_LENGTH)
-            self.set_combo_value(self.gate_length, value)
-            value = self.connector.get_parameter(connector.STEP_ON)
-            self.set_combo_value(self.step_on, value)
-            value = self.connector.get_parameter(connector.SYNC)
-            self.set_combo_value(self.sync, value)
-            self.configuring = False
+            values = self.connector.get_parameters(connector.PARAMETERS)
+            self.bindings.apply(values)
             conn_msg = _('Connected (firmware version {:s})').format(
                 self.connector.sw_version)
         else:
@@ -297,6 +434,8 @@ class Editor(object):
         self.save_button.set_sensitive(self.connector.connected())
         self.open_button.set_sensitive(self.connector.connected())
         self.calibrate_button.set_sensitive(self.connector.connected())
+        self.snapshot_combo.set_sensitive(self.connector.connected())
+        self.snapshot_button.set_sensitive(self.connector.connected())
 
     def show_open(self):
         dialog = Gtk.FileChooserDialog('Open', self.main_window,
@@ -347,11 +486,9 @@ class Editor(object):
 
     def save_sequence_file(self, filename):
         try:
-            sequences = []
-            for i in range(8):
-                sequences.append(self.connector.get_sequence(i))
-            with open(filename, 'w') as output_file:
-                output_file.write('\r\n'.join(sequences))
+            backup = SequenceBackup(
+                self.connector, filename, self.config[utils.DEVICE])
+            backup.run()
         except ConnectorError as e:
             self.show_error(e)
             self.ui_reconnect()
@@ -361,42 +498,50 @@ class Editor(object):
         self.statusbar.pop(self.context_id)
         self.statusbar.push(self.context_id, msg)
 
-    def set_combo_value(self, combo, value):
-        model = combo.get_model()
-        active = 0
-        found = False
-        for item in model:
-            if item[1] == value:
-                found = True
-                break
-            active += 1
-        if found:
-            combo.set_active(active)
-
-    def set_parameter_from_spin(self, param, spin):
-        value = spin.get_value_as_int()
-        self.set_parameter_from_interface(param, value)
-
-    def set_parameter_from_combo(self, param, combo):
-        value = combo.get_model()[combo.get_active()][1]
-        self.set_parameter_from_interface(param, value)
-
-    def set_parameter_from_switch(self, param, value, switch):
-        switch.set_state(value)
-        switch.set_active(value)
-        self.set_parameter_from_interface(param, value)
-
     def set_parameter_from_interface(self, param, value):
-        if not self.configuring:
-            try:
-                value = self.connector.set_parameter(
-                    param, value, self.config[utils.PERSISTENT])
-            except ConnectorError as e:
-                value = False
-                self.show_error(e)
-                self.ui_reconnect()
+        try:
+            self.connector.set_parameter(
+                param, value, self.config.get_device_value(utils.PERSISTENT))
+        except ConnectorError as e:
+            self.show_error(e)
+            self.ui_reconnect()
+
+    def store_snapshot(self):
+        name = self.snapshot_combo.get_active_text().strip()
+        if not name:
+            return
+        try:
+            self.snapshots.capture(name)
+        except ConnectorError as e:
+            self.show_error(e)
+            self.ui_reconnect()
+            return
+        if name not in [row[0] for row in self.snapshot_combo.get_model()]:
+            self.snapshot_combo.append_text(name)
+        self.set_status_msg(_('Snapshot {:s} stored').format(name))
+
+    def recall_snapshot(self):
+        # Typing a name in the entry changes the combo too
+        if self.snapshot_combo.get_active() == -1:
+            return
+        name = self.snapshot_combo.get_active_text()
+        commit = self.config.get_device_value(utils.PERSISTENT)
+        try:
+            self.snapshots.recall(name, commit)
+        except ConnectorError as e:
+            self.show_error(e)
+            self.ui_reconnect()
+            return
+        self.bindings.apply(self.connector.values)
+        self.set_status_msg(_('Snapshot {:s} recalled').format(name))
+
+    def calibration_failed(self, exception):
+        self.show_error(exception, desc=_('Calibration failed'))
+        self.ui_reconnect()
 
     def show_error(self, exception, desc=None):
+        if isinstance(exception, ConnectorError):
+            self.connector.dump_trace()
         msg = str(exception)
         dialog = Gtk.MessageDialog(self.main_window,
                                    flags=Gtk.DialogFlags.MODAL,
@@ -422,5 +567,12 @@ class Editor(object):
     def main(self):
         self.init_ui()
         self.set_ui_config()
+        if profiler:
+            GLib.timeout_add(
+                int(HEARTBEAT_INTERVAL * 1000), profiler.beat)
+            profiler.start()
         Gtk.main()
+        if profiler:
+            profiler.stop()
+            profiler.write_summary()
         utils.write_config(self.config)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude device image"""
+
+from microdude import connector
+import struct
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXTENSION = '.mbimg'
+MAGIC = b'MDIMG'
+IMAGE_VERSION = 1
+SEQUENCE_LENGTH = len(connector.FRAGMENT_OFFSETS) * connector.FRAGMENT_LENGTH
+STEPS_LENGTH = connector.SEQUENCES * SEQUENCE_LENGTH
+
+IMAGE_ERROR = 'Error in device image file'
+
+SENT = 'sent'
+
+
+def normalize_steps(steps):
+    """Return the steps with everything after the end of each sequence set to 0."""
+    normalized = bytearray(steps)
+    for start in range(0, STEPS_LENGTH, SEQUENCE_LENGTH):
+        end = normalized.find(0, start, start + SEQUENCE_LENGTH)
+        if end >= 0:
+            normalized[end:start + SEQUENCE_LENGTH] = bytes(
+                start + SEQUENCE_LENGTH - end)
+    return bytes(normalized)
+
+
+class DeviceImage(object):
+    """All the parameters and the step memory of a MicroBrute.
+
+    steps holds the 8 sequences of 64 steps in the format used by the device.
+    """
+
+    def __init__(self, parameters, steps):
+        if len(steps) != STEPS_LENGTH:
+            raise ValueError(IMAGE_ERROR)
+        self.parameters = dict(parameters)
+        self.steps = normalize_steps(steps)
+
+    def get_end(self, seq_id):
+        """Return the position of the end of the sequence."""
+        start = seq_id * SEQUENCE_LENGTH
+        end = self.steps.find(0, start, start + SEQUENCE_LENGTH)
+        return SEQUENCE_LENGTH if end < 0 else end - start
+
+    def get_fragment(self, seq_id, offset):
+        start = seq_id * SEQUENCE_LENGTH + offset
+        return list(self.steps[start:start + connector.FRAGMENT_LENGTH])
+
+    def to_bytes(self):
+        data = bytearray(MAGIC)
+        data.extend(struct.pack('<BB', IMAGE_VERSION, len(self.parameters)))
+        for param in sorted(self.parameters):
+            data.extend(struct.pack('<BB', param, self.parameters[param]))
+        data.extend(self.steps)
+        data.extend(struct.pack('<I', zlib.crc32(data)))
+        return bytes(data)
+
+
+def from_bytes(data):
+    """Return the DeviceImage contained in the given bytes checking the format and the checksum."""
+    header_length = len(MAGIC) + 2
+    if len(data) < header_length + 4 or data[0:len(MAGIC)] != MAGIC:
+        raise ValueError(IMAGE_ERROR)
+    (checksum,) = struct.unpack('<I', data[-4:])
+    if zlib.crc32(data[:-4]) != checksum:
+        raise ValueError(IMAGE_ERROR)
+    version, count = struct.unpack(
+        '<BB', data[len(MAGIC):header_length])
+    if version != IMAGE_VERSION:
+        raise ValueError(IMAGE_ERROR)
+    steps_start = header_length + count * 2
+    if len(data) != steps_start + STEPS_LENGTH + 4:
+        raise ValueError(IMAGE_ERROR)
+    # SysEx data bytes are 7 bits long
+    if max(data[header_length:steps_start + STEPS_LENGTH], default=0) > 0x7F:
+        raise ValueError(IMAGE_ERROR)
+    parameters = {}
+    for i in range(header_length, steps_start, 2):
+        # Other ids, like the calibration ones, must never be written
+        if data[i] not in connector.PARAMETERS:
+            raise ValueError(IMAGE_ERROR)
+        parameters[data[i]] = data[i + 1]
+    return DeviceImage(parameters, data[steps_start:steps_start + STEPS_LENGTH])
+
+
+def read_image(filename):
+    with open(filename, 'rb') as input_file:
+        return from_bytes(input_file.read())
+
+
+def write_image(image, filename):
+    with open(filename, 'wb') as output_file:
+        output_file.write(image.to_bytes())
+
+
+def get_fragment_keys():
+    keys = []
+    for seq_id in range(connector.SEQUENCES):
+        for offset in connector.FRAGMENT_OFFSETS:
+            keys.append((seq_id, offset))
+    return keys
+
+
+def capture(conn):
+    """Return the DeviceImage of the MicroBrute connected to the given Connector."""
+    parameters = conn.get_parameters(connector.PARAMETERS)
+    steps = bytearray()
+    for fragment in conn.get_sequence_fragments(get_fragment_keys()):
+        steps.extend(fragment)
+    return DeviceImage(parameters, steps)
+
+
+def restore(conn, image, verify=False):
+    """Write the image only sending what differs from the device and return a summary.
+
+    Fragments after the end of a sequence in a previous fragment are not compared nor sent.
+    The summary holds the parameters and (seq_id, offset) fragments SENT. If verify is True, the
+    written values are read back and sent again if needed and the CONFIRMED and FAILED ones are
+    in the summary too. Otherwise, these are empty.
+    """
+    live = capture(conn)
+    parameters = {}
+    for param, value in image.parameters.items():
+        if live.parameters.get(param) != value:
+            logger.debug('Setting parameter %d to %d...', param, value)
+            parameters[param] = value
+    fragments = {}
+    for seq_id, offset in get_fragment_keys():
+        if offset > image.get_end(seq_id):
+            continue
+        fragment = image.get_fragment(seq_id, offset)
+        if live.get_fragment(seq_id, offset) != fragment:
+            logger.debug('Setting sequence %d at %d...', seq_id, offset)
+            fragments[(seq_id, offset)] = fragment
+    summary = {SENT: list(parameters) + list(fragments),
+               connector.CONFIRMED: [], connector.FAILED: []}
+    for result in [conn.set_parameters(parameters, verify),
+                   conn.set_sequence_fragments(fragments, verify)]:
+        if result:
+            for key in [connector.CONFIRMED, connector.FAILED]:
+                summary[key].extend(result[key])
+    return summary
+
+
+def clone(source, target, verify=False):
+    """Copy the full setup of the source Connector to the target one. See restore for verify."""
+    return restore(target, capture(source), verify)
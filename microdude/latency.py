@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude MIDI backend latency probe"""
+
+from microdude import connector
+from microdude import utils
+from microdude.discovery import Discovery
+import mido
+import statistics
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROBE_ROUNDS = 20
+PROBE_TIMEOUT = 1
+POLL_TIME = 0.0005
+
+MEAN = 'mean'
+JITTER = 'jitter'
+MIN = 'min'
+MAX = 'max'
+LOST = 'lost'
+
+
+def get_available_backends():
+    available = []
+    for name in connector.BACKENDS:
+        try:
+            mido.Backend(name, load=True)
+            available.append(name)
+        except (ImportError, OSError) as e:
+            logger.debug('Backend %s not available: "%s"', name, str(e))
+    return available
+
+
+def find_port(backend, device):
+    """Return the name of the device port in the given backend as names differ among backends."""
+    if not device:
+        return None
+    names = backend.get_ioport_names()
+    if device in names:
+        return device
+    for name in names:
+        if name in device or device in name:
+            return name
+    for name in names:
+        if 'MicroBrute' in name and 'MicroBrute' in device:
+            return name
+    return None
+
+
+def measure(port, rounds=PROBE_ROUNDS):
+    """Return the round trip times of an inquiry request.
+
+    Any SysEx message received counts as the reply so a loopback port can be measured too.
+    """
+    times = []
+    lost = 0
+    msg = mido.Message('sysex', data=connector.INQUIRY_REQ)
+    for i in range(rounds):
+        for pending in port.iter_pending():
+            pass
+        start = time.perf_counter()
+        port.send(msg)
+        received = False
+        while not received and time.perf_counter() - start < PROBE_TIMEOUT:
+            for reply in port.iter_pending():
+                if reply.type == 'sysex':
+                    received = True
+                    break
+            if not received:
+                time.sleep(POLL_TIME)
+        if received:
+            times.append(time.perf_counter() - start)
+        else:
+            lost += 1
+    return times, lost
+
+
+def get_stats(times, lost):
+    if not times:
+        return {MEAN: None, JITTER: None, MIN: None, MAX: None, LOST: lost}
+    return {
+        MEAN: statistics.mean(times),
+        JITTER: statistics.pstdev(times),
+        MIN: min(times),
+        MAX: max(times),
+        LOST: lost
+    }
+
+
+def probe(device, rounds=PROBE_ROUNDS):
+    """Return the latency statistics of every available backend for the given device or loopback port."""
+    results = {}
+    for name in get_available_backends():
+        backend = mido.Backend(name, load=True)
+        port_name = find_port(backend, device)
+        if port_name is None:
+            logger.debug('Port not found in backend %s', name)
+            continue
+        try:
+            port = backend.open_ioport(port_name)
+        except IOError as e:
+            logger.error('Port %s could not be opened with backend %s: "%s"',
+                         port_name, name, str(e))
+            continue
+        try:
+            results[name] = get_stats(*measure(port, rounds))
+        finally:
+            port.close()
+        logger.debug('Backend %s: %s', name, str(results[name]))
+    return results
+
+
+def get_fastest(results):
+    """Return the backend with the lowest mean round trip time among the ones that lost no replies."""
+    fastest = None
+    for name, stats in results.items():
+        if stats[LOST] or stats[MEAN] is None:
+            continue
+        if fastest is None or stats[MEAN] < results[fastest][MEAN]:
+            fastest = name
+    return fastest
+
+
+def choose_backend(device, rounds=PROBE_ROUNDS, discovery=None):
+    """Probe all the backends, store the fastest one in the device configuration and return it with the results.
+
+    device might be a unit identity or a port name. The configuration is stored under the identity.
+    """
+    if discovery is None:
+        discovery = Discovery()
+    port = discovery.get_port(device) or device
+    results = probe(port, rounds)
+    fastest = get_fastest(results)
+    if fastest:
+        identity = discovery.get_identity(port) or device
+        config = utils.read_config()
+        config.set_device_value(utils.BACKEND, fastest, identity)
+        utils.write_config(config)
+    return fastest, results
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude sequence library"""
+
+from microdude import utils
+from microdude.connector import SEQ_FILE_ERROR
+import bisect
+import datetime
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_FILE = utils.CONFIG_DIR + '/library'
+LIBRARY_VERSION = 1
+MAX_SEQUENCES_PER_FILE = 8
+MAX_STEPS = 64
+# 0 ends a sequence and 0x7F is a rest
+MIN_NOTE = 1
+MAX_NOTE = 0x7E
+
+STEPS = 'steps'
+LENGTH = 'length'
+LOW = 'low'
+HIGH = 'high'
+SOURCES = 'sources'
+SOURCE_DEVICE = 'device'
+SOURCE_DATE = 'date'
+SOURCE_SLOT = 'slot'
+
+
+def parse_sequence_string(sequence):
+    """Return the 0 based seq_id and the steps of a sequence in Arturia's format."""
+    aux = sequence.strip().split(':')
+    if len(aux) != 2 or not len(aux[0]) or not len(aux[1].strip()):
+        raise ValueError(SEQ_FILE_ERROR)
+    try:
+        seq_id = int(aux[0]) - 1
+        steps = aux[1].split()
+    except ValueError:
+        raise ValueError(SEQ_FILE_ERROR)
+    if seq_id < 0 or seq_id >= MAX_SEQUENCES_PER_FILE:
+        raise ValueError(SEQ_FILE_ERROR)
+    check_steps(steps)
+    return seq_id, steps
+
+
+def check_steps(steps):
+    """Raise a ValueError if the steps are not notes between MIN_NOTE and MAX_NOTE or rests."""
+    if len(steps) > MAX_STEPS:
+        raise ValueError(SEQ_FILE_ERROR)
+    for step in steps:
+        if step == 'x':
+            continue
+        try:
+            note = int(step)
+        except ValueError:
+            raise ValueError(SEQ_FILE_ERROR)
+        if note < MIN_NOTE or note > MAX_NOTE:
+            raise ValueError(SEQ_FILE_ERROR)
+
+
+def get_sequence_hash(steps):
+    """Return the content hash of the given steps regardless of the slot they were in."""
+    return hashlib.sha1(' '.join(steps).encode('ascii')).hexdigest()
+
+
+class Library(object):
+    """Content addressed store of sequences with indexes by device, date, length and note range"""
+
+    def __init__(self, filename=LIBRARY_FILE):
+        self.filename = filename
+        self.sequences = {}
+        self.by_device = {}
+        self.by_length = {}
+        self.by_date = []
+        self.by_low = []
+        self.by_high = []
+        self.load()
+
+    def load(self):
+        self.sequences = {}
+        try:
+            with open(self.filename, 'r') as file:
+                data = json.loads(file.read())
+            if data.get('version') != LIBRARY_VERSION:
+                raise ValueError('Unsupported library version')
+            self.sequences = data['sequences']
+            logger.debug('Library loaded with %d sequences.',
+                         len(self.sequences))
+        except FileNotFoundError:
+            logger.debug('Library not found. Creating an empty one...')
+        except (IOError, ValueError, KeyError) as e:
+            logger.error('Library could not be read: {:s}'.format(str(e)))
+        self.build_indexes()
+
+    def save(self):
+        """Write the library atomically so that a crash never leaves it half written."""
+        data = {'version': LIBRARY_VERSION, 'sequences': self.sequences}
+        utils.write_atomically(self.filename, json.dumps(data))
+
+    def build_indexes(self):
+        self.by_device = {}
+        self.by_length = {}
+        self.by_date = []
+        self.by_low = []
+        self.by_high = []
+        for h, entry in self.sequences.items():
+            self.index_entry(h, entry)
+            for source in entry[SOURCES]:
+                self.index_source(h, source)
+
+    def index_entry(self, h, entry):
+        self.by_length.setdefault(entry[LENGTH], set()).add(h)
+        # Sequences with rests only have no range
+        if entry[LOW] is not None:
+            bisect.insort(self.by_low, (entry[LOW], h))
+            bisect.insort(self.by_high, (entry[HIGH], h))
+
+    def index_source(self, h, source):
+        self.by_device.setdefault(source[SOURCE_DEVICE], set()).add(h)
+        bisect.insort(self.by_date, (source[SOURCE_DATE], h))
+
+    def add(self, steps, device='', date=None, slot=None):
+        """Add a sequence and return its hash. Sequences already in the library only get the new source."""
+        check_steps(steps)
+        if date is None:
+            date = datetime.date.today().isoformat()
+        h = get_sequence_hash(steps)
+        entry = self.sequences.get(h)
+        if entry is None:
+            notes = [int(s) for s in steps if s != 'x']
+            entry = {
+                STEPS: ' '.join(steps),
+                LENGTH: len(steps),
+                LOW: min(notes) if notes else None,
+                HIGH: max(notes) if notes else None,
+                SOURCES: []
+            }
+            self.sequences[h] = entry
+            self.index_entry(h, entry)
+        source = {SOURCE_DEVICE: device, SOURCE_DATE: date, SOURCE_SLOT: slot}
+        if source not in entry[SOURCES]:
+            entry[SOURCES].append(source)
+            self.index_source(h, source)
+        return h
+
+    def get_steps(self, h):
+        return self.sequences[h][STEPS].split(' ')
+
+    def get_sources(self, h):
+        """Return where and when the given sequence was seen."""
+        return self.sequences[h][SOURCES]
+
+    def find(self, steps):
+        """Return the hash of the given steps if they are in the library or None otherwise."""
+        h = get_sequence_hash(steps)
+        return h if h in self.sequences else None
+
+    def search(self, device=None, date_from=None, date_to=None, length=None, low=None, high=None):
+        """Return the hashes of the sequences matching all the given criteria.
+
+        low and high are inclusive bounds every note in the sequence must fall into. Sequences with
+        rests only are not returned if any of them is given.
+        """
+        candidates = None
+        if device is not None:
+            candidates = set(self.by_device.get(device, ()))
+        if length is not None:
+            found = self.by_length.get(length, set())
+            candidates = found.copy() if candidates is None else candidates & found
+        if date_from is not None or date_to is not None:
+            start = 0
+            end = len(self.by_date)
+            if date_from is not None:
+                start = bisect.bisect_left(self.by_date, (date_from,))
+            if date_to is not None:
+                end = bisect.bisect_right(self.by_date, (date_to, '\xff'))
+            found = set(h for _, h in self.by_date[start:end])
+            candidates = found if candidates is None else candidates & found
+        if low is not None:
+            start = bisect.bisect_left(self.by_low, (low,))
+            found = set(h for _, h in self.by_low[start:])
+            candidates = found if candidates is None else candidates & found
+        if high is not None:
+            end = bisect.bisect_right(self.by_high, (high, '\xff'))
+            found = set(h for _, h in self.by_high[:end])
+            candidates = found if candidates is None else candidates & found
+        if candidates is None:
+            candidates = set(self.sequences)
+        return candidates
+
+    def import_file(self, filename, device='', date=None):
+        """Import the sequences of a .mbseq file and return their hashes."""
+        hashes = []
+        with open(filename, 'r') as input_file:
+            for line in input_file:
+                if not line.strip():
+                    continue
+                seq_id, steps = parse_sequence_string(line)
+                hashes.append(self.add(steps, device, date, seq_id))
+        return hashes
+
+    def export_file(self, hashes, filename):
+        """Write the given sequences into a .mbseq file in consecutive slots."""
+        if len(hashes) > MAX_SEQUENCES_PER_FILE:
+            raise ValueError('Too many sequences')
+        sequences = []
+        for i, h in enumerate(hashes):
+            sequences.append('{:d}:{:s}'.format(
+                i + 1, self.sequences[h][STEPS]))
+        with open(filename, 'w') as output_file:
+            output_file.write('\r\n'.join(sequences))
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude responsiveness profiler"""
+
+import functools
+import sys
+import threading
+import time
+import traceback
+import logging
+
+logger = logging.getLogger(__name__)
+
+STALL_THRESHOLD = 0.1
+HEARTBEAT_INTERVAL = 0.02
+MAX_STALLS = 20
+
+
+class Stall(object):
+    """Main loop stall with the calls being run and the stack of the main thread when it was detected."""
+
+    def __init__(self, start, calls, stack):
+        self.start = start
+        self.duration = None
+        self.calls = calls
+        self.stack = stack
+
+
+class Profiler(object):
+    """Time the wrapped functions and detect the main loop stalls.
+
+    beat must be called periodically from the main loop, every HEARTBEAT_INTERVAL. A watchdog
+    thread records a stall, with the stack of the main thread, when the main loop has not beaten
+    for more than the threshold.
+    """
+
+    def __init__(self, threshold=STALL_THRESHOLD):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.calls = []
+        self.stalls = []
+        self.stall = None
+        self.last_beat = time.monotonic()
+        self.main_thread = threading.main_thread()
+        self.running = False
+        self.watchdog = None
+
+    def wrap(self, name, function):
+        """Return the function recording the time it takes under the given name."""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            main = threading.current_thread() is self.main_thread
+            if main:
+                self.calls.append(name)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+                if main:
+                    self.calls.pop()
+        return wrapper
+
+    def instrument(self, obj, names, prefix):
+        """Replace the given methods of an object with wrapped ones."""
+        for name in names:
+            setattr(obj, name, self.wrap(prefix + '.' + name, getattr(obj, name)))
+
+    def record(self, name, duration):
+        with self.lock:
+            count, total, maximum = self.timings.get(name, (0, 0, 0))
+            self.timings[name] = (count + 1, total + duration,
+                                  max(maximum, duration))
+
+    def beat(self):
+        """Main loop heartbeat. It returns True to be used as a GLib timeout callback."""
+        now = time.monotonic()
+        with self.lock:
+            if self.stall:
+                self.stall.duration = now - self.stall.start
+                logger.debug('Main loop stalled for %.3f s',
+                             self.stall.duration)
+                self.stall = None
+            self.last_beat = now
+        return True
+
+    def check(self):
+        """Record a stall if the main loop has not beaten in time."""
+        now = time.monotonic()
+        with self.lock:
+            if self.stall or now - self.last_beat <= self.threshold:
+                return
+            frame = sys._current_frames().get(self.main_thread.ident)
+            stack = traceback.format_stack(frame) if frame else []
+            self.stall = Stall(self.last_beat, list(self.calls), stack)
+            if len(self.stalls) < MAX_STALLS:
+                self.stalls.append(self.stall)
+
+    def start(self):
+        self.last_beat = time.monotonic()
+        self.running = True
+        self.watchdog = threading.Thread(target=self.watch, daemon=True)
+        self.watchdog.start()
+
+    def watch(self):
+        while self.running:
+            time.sleep(HEARTBEAT_INTERVAL)
+            self.check()
+
+    def stop(self):
+        self.running = False
+        if self.watchdog:
+            self.watchdog.join()
+            self.watchdog = None
+
+    def get_summary(self):
+        lines = ['Calls (count, total s, mean s, max s):']
+        timings = sorted(self.timings.items(),
+                         key=lambda item: item[1][2], reverse=True)
+        for name, (count, total, maximum) in timings:
+            lines.append('  {:s}: {:d}, {:.3f}, {:.3f}, {:.3f}'.format(
+                name, count, total, total / count, maximum))
+        lines.append('Main loop stalls over {:.3f} s: {:d}'.format(
+            self.threshold, len(self.stalls)))
+        for stall in self.stalls:
+            duration = 'unfinished' if stall.duration is None else '{:.3f} s'.format(
+                stall.duration)
+            lines.append('  Stall of {:s} in {:s}'.format(
+                duration, ' > '.join(stall.calls) or 'unknown call'))
+            for entry in stall.stack:
+                lines.extend(
+                    ['    ' + line for line in entry.rstrip().split('\n')])
+        return '\n'.join(lines)
+
+    def write_summary(self, output=None):
+        (output or sys.stderr).write(self.get_summary() + '\n')
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude MIDI traffic recorder and replayer"""
+
+import mido
+import struct
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXTENSION = '.mbtrace'
+MAGIC = b'MDTRACE'
+TRACE_VERSION = 1
+TX = 0
+RX = 1
+
+# Direction, seconds since the start of the session and length of the message bytes
+RECORD = struct.Struct('<BdH')
+
+TRACE_ERROR = 'Error in trace file'
+
+
+def read_trace(filename):
+    """Yield the direction, time and message of every record in a trace file."""
+    with open(filename, 'rb') as file:
+        header = file.read(len(MAGIC) + 1)
+        if header[0:len(MAGIC)] != MAGIC or header[-1] != TRACE_VERSION:
+            raise ValueError(TRACE_ERROR)
+        while True:
+            record = file.read(RECORD.size)
+            if not record:
+                break
+            if len(record) != RECORD.size:
+                raise ValueError(TRACE_ERROR)
+            direction, timestamp, length = RECORD.unpack(record)
+            data = file.read(length)
+            if len(data) != length:
+                raise ValueError(TRACE_ERROR)
+            yield direction, timestamp, mido.Message.from_bytes(data)
+
+
+class Recorder(object):
+    """Port factory for Connector writing the messages of every port it opens to the same trace file.
+
+    The file is created with the first port so that the reconnections after a failure are recorded
+    after it. Every record is flushed so nothing is lost if the application crashes.
+    """
+
+    def __init__(self, filename, factory=None):
+        self.filename = filename
+        self.factory = factory
+        self.file = None
+        self.start = None
+
+    def __call__(self, device):
+        factory = self.factory or mido.open_ioport
+        port = factory(device)
+        if self.file is None:
+            self.file = open(self.filename, 'wb')
+            self.file.write(MAGIC + bytes([TRACE_VERSION]))
+            self.file.flush()
+            self.start = time.monotonic()
+        return RecordingPort(port, self)
+
+    def record(self, direction, msg):
+        data = bytes(msg.bytes())
+        self.file.write(RECORD.pack(
+            direction, time.monotonic() - self.start, len(data)))
+        self.file.write(data)
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class RecordingPort(object):
+    """Port wrapper writing every message sent and received through a Recorder"""
+
+    def __init__(self, port, recorder):
+        self.port = port
+        self.recorder = recorder
+
+    def send(self, msg):
+        self.port.send(msg)
+        self.recorder.record(TX, msg)
+
+    def iter_pending(self):
+        for msg in self.port.iter_pending():
+            self.recorder.record(RX, msg)
+            yield msg
+
+    def close(self):
+        self.port.close()
+
+
+def get_recording_factory(filename, factory=None):
+    """Return a port factory for Connector that records all the sessions to the given file."""
+    return Recorder(filename, factory)
+
+
+class ReplayPort(object):
+    """Port feeding a recorded session back.
+
+    Every message received after a sent one is available with the same delay it had in the recording
+    or immediately if realtime is False. Sent messages that differ from the recorded ones are logged.
+    """
+
+    def __init__(self, filename, realtime=True):
+        self.records = list(read_trace(filename))
+        self.realtime = realtime
+        self.next = 0
+        self.pending = []
+        self.anchor = (time.monotonic(), 0)
+        self.mismatches = 0
+
+    def send(self, msg):
+        # Messages not read yet stay pending as they would in a real port
+        while self.next < len(self.records) and self.records[self.next][0] != TX:
+            self.pending.append(self.records[self.next][2])
+            self.next += 1
+        if self.next == len(self.records):
+            logger.warning('Message %s sent after the end of the trace', msg)
+            self.mismatches += 1
+            return
+        direction, timestamp, recorded = self.records[self.next]
+        if recorded.bytes() != msg.bytes():
+            logger.warning('Message %s differs from recorded %s', msg, recorded)
+            self.mismatches += 1
+        self.anchor = (time.monotonic(), timestamp)
+        self.next += 1
+
+    def iter_pending(self):
+        while self.pending:
+            yield self.pending.pop(0)
+        while self.next < len(self.records):
+            direction, timestamp, msg = self.records[self.next]
+            if direction != RX:
+                break
+            if self.realtime:
+                elapsed = time.monotonic() - self.anchor[0]
+                if elapsed < timestamp - self.anchor[1]:
+                    break
+            self.next += 1
+            yield msg
+
+    def close(self):
+        logger.debug('Replay closed with %d mismatches', self.mismatches)
+
+
+def get_replay_factory(filename, realtime=True):
+    """Return a port factory for Connector that replays the sessions in the given file.
+
+    Every port opened continues where the previous one stopped as reconnections are recorded in the same file.
+    """
+    port = ReplayPort(filename, realtime)
+    return lambda device: port
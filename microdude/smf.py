@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude Standard MIDI File conversion"""
+
+from microdude import library
+from microdude import transform
+import math
+import struct
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXTENSION = '.mid'
+MAX_STEPS = transform.SEQUENCE_LENGTH
+DEFAULT_STEP_LENGTH = 16
+DEFAULT_DIVISION = 96
+DEFAULT_GATE = 0.5
+DEFAULT_VELOCITY = 100
+BUFFER_SIZE = 4096
+
+SMF_ERROR = 'Error in MIDI file'
+
+# Data bytes of the channel messages indexed by the high nibble of the status byte
+DATA_LENGTHS = {0x8: 2, 0x9: 2, 0xA: 2, 0xB: 2, 0xC: 1, 0xD: 1, 0xE: 2}
+
+
+class ChunkReader(object):
+    """Buffered reader limited to the bytes of a chunk"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+        self.buffer = b''
+        self.position = 0
+
+    def fill(self):
+        size = min(BUFFER_SIZE, self.remaining)
+        self.buffer = self.file.read(size)
+        if len(self.buffer) != size:
+            raise ValueError(SMF_ERROR)
+        self.remaining -= size
+        self.position = 0
+
+    def at_end(self):
+        return self.position == len(self.buffer) and self.remaining == 0
+
+    def read_byte(self):
+        if self.position == len(self.buffer):
+            if self.remaining == 0:
+                raise ValueError(SMF_ERROR)
+            self.fill()
+        value = self.buffer[self.position]
+        self.position += 1
+        return value
+
+    def read_vlq(self):
+        value = 0
+        for i in range(4):
+            byte = self.read_byte()
+            value = (value << 7) | (byte & 0x7F)
+            if not byte & 0x80:
+                return value
+        raise ValueError(SMF_ERROR)
+
+    def skip(self, length):
+        available = len(self.buffer) - self.position
+        if length <= available:
+            self.position += length
+        else:
+            length -= available
+            if length > self.remaining:
+                raise ValueError(SMF_ERROR)
+            self.file.seek(length, 1)
+            self.remaining -= length
+            self.buffer = b''
+            self.position = 0
+
+    def skip_chunk(self):
+        self.file.seek(self.remaining, 1)
+        self.remaining = 0
+        self.buffer = b''
+        self.position = 0
+
+
+def read_chunk_header(file):
+    header = file.read(8)
+    if len(header) == 0:
+        return None, 0
+    if len(header) != 8:
+        raise ValueError(SMF_ERROR)
+    return struct.unpack('>4sI', header)
+
+
+def iter_note_ons(reader, end_of_track=False):
+    """Yield the absolute tick, channel, note and velocity of every note on event in the track.
+
+    If end_of_track is True, the end of track event is yielded too with None as channel, note and velocity.
+    """
+    tick = 0
+    status = None
+    while not reader.at_end():
+        tick += reader.read_vlq()
+        byte = reader.read_byte()
+        if byte == 0xFF:
+            meta_type = reader.read_byte()
+            reader.skip(reader.read_vlq())
+            if meta_type == 0x2F and end_of_track:
+                yield tick, None, None, None
+            continue
+        if byte == 0xF0 or byte == 0xF7:
+            reader.skip(reader.read_vlq())
+            continue
+        if byte & 0x80:
+            status = byte
+            first = reader.read_byte()
+        elif status is None:
+            raise ValueError(SMF_ERROR)
+        else:
+            first = byte
+        length = DATA_LENGTHS.get(status >> 4)
+        if length is None:
+            raise ValueError(SMF_ERROR)
+        second = reader.read_byte() if length == 2 else 0
+        if status >> 4 == 0x9 and second > 0:
+            yield tick, status & 0xF, first, second
+
+
+def read_steps(file, step_length=DEFAULT_STEP_LENGTH, channel=None):
+    """Return the notes of the file quantized to up to 64 steps with None in the rests.
+
+    Tracks are parsed event by event and the rest of a track is skipped as soon as it goes beyond the last step.
+    When several notes fall into the same step the one from the earliest track and tick is kept.
+    The length, trailing rests included, is given by the end of the tracks with notes.
+    """
+    chunk_type, length = read_chunk_header(file)
+    if chunk_type != b'MThd' or length < 6:
+        raise ValueError(SMF_ERROR)
+    header = file.read(length)
+    if len(header) != length:
+        raise ValueError(SMF_ERROR)
+    _, tracks, division = struct.unpack('>HHH', header[0:6])
+    if division & 0x8000:
+        raise ValueError('SMPTE time division is not supported')
+    if division == 0:
+        raise ValueError(SMF_ERROR)
+    step_ticks = division * 4.0 / step_length
+    last_tick = (MAX_STEPS - 0.5) * step_ticks
+    steps = [None] * MAX_STEPS
+    sequence_length = 0
+    for i in range(tracks):
+        chunk_type, length = read_chunk_header(file)
+        if chunk_type is None:
+            break
+        reader = ChunkReader(file, length)
+        if chunk_type != b'MTrk':
+            reader.skip_chunk()
+            continue
+        end = None
+        used = False
+        for tick, chan, note, velocity in iter_note_ons(reader, True):
+            if tick >= last_tick:
+                end = MAX_STEPS * step_ticks
+                break
+            if note is None:
+                end = tick
+                continue
+            if channel is not None and chan != channel:
+                continue
+            used = True
+            step = int(round(tick / step_ticks))
+            if steps[step] is None:
+                steps[step] = transform.clip(note)
+        reader.skip_chunk()
+        if used and end is not None:
+            sequence_length = max(sequence_length, min(
+                MAX_STEPS, math.ceil(end / step_ticks)))
+    while len(steps) > sequence_length and steps[-1] is None:
+        steps.pop()
+    return steps
+
+
+def read_sequence(filename, seq_id=0, step_length=DEFAULT_STEP_LENGTH, channel=None):
+    """Return the sequence in Arturia's format for the given 0 based seq_id from a MIDI file."""
+    with open(filename, 'rb') as input_file:
+        steps = read_steps(input_file, step_length, channel)
+    if not steps:
+        raise ValueError('No notes found in MIDI file')
+    notes = ['x' if s is None else str(s) for s in steps]
+    return '{:d}:{:s}'.format(seq_id + 1, ' '.join(notes))
+
+
+def read_sequences(filenames, step_length=DEFAULT_STEP_LENGTH, channel=None):
+    """Return the sequences in Arturia's format for up to 8 MIDI files in consecutive slots.
+
+    The result can be sent with Connector.set_sequence or written as the lines of a .mbseq file.
+    """
+    if len(filenames) > library.MAX_SEQUENCES_PER_FILE:
+        raise ValueError('Too many sequences')
+    sequences = []
+    for seq_id, filename in enumerate(filenames):
+        sequences.append(read_sequence(
+            filename, seq_id, step_length, channel))
+    return sequences
+
+
+def get_vlq(value):
+    data = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        data.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(data)
+
+
+def write_sequence(sequence, filename, step_length=DEFAULT_STEP_LENGTH, division=DEFAULT_DIVISION,
+                   gate=DEFAULT_GATE, channel=0, velocity=DEFAULT_VELOCITY):
+    """Write a sequence in Arturia's format, as returned by Connector.get_sequence, as a MIDI file."""
+    seq_id, steps = library.parse_sequence_string(sequence)
+    step_ticks = division * 4 // step_length
+    gate_ticks = max(1, min(step_ticks, int(step_ticks * gate)))
+    events = []
+    for i, step in enumerate(steps):
+        if step == 'x':
+            continue
+        note = int(step)
+        start = i * step_ticks
+        # Note offs go before note ons at the same tick
+        events.append((start, 1, bytes([0x90 | channel, note, velocity])))
+        events.append((start + gate_ticks, 0, bytes([0x80 | channel, note, 0])))
+    events.sort(key=lambda e: (e[0], e[1]))
+    track = bytearray()
+    tick = 0
+    for time, _, data in events:
+        track.extend(get_vlq(time - tick))
+        track.extend(data)
+        tick = time
+    track.extend(get_vlq(len(steps) * step_ticks - tick))
+    track.extend(b'\xFF\x2F\x00')
+    with open(filename, 'wb') as output_file:
+        output_file.write(struct.pack('>4sIHHH', b'MThd', 6, 0, 1, division))
+        output_file.write(struct.pack('>4sI', b'MTrk', len(track)))
+        output_file.write(track)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude parameter snapshots"""
+
+from microdude import connector
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotMemory(object):
+    """Named snapshots of the parameters recalled by sending only what differs from the device.
+
+    The device state is the one known by the Connector, which keeps the last values read from or
+    written to the MicroBrute, both the ones in use, including the MIDI controllers, and the
+    persisted ones. The parameters that are not known yet are always sent.
+    """
+
+    def __init__(self, conn):
+        self.connector = conn
+        self.snapshots = {}
+
+    def capture(self, name, values=None):
+        """Save the given values or the ones in the MicroBrute as a snapshot."""
+        if values is None:
+            values = self.connector.get_parameters(connector.PARAMETERS)
+        self.snapshots[name] = dict(values)
+
+    def delete(self, name):
+        del self.snapshots[name]
+
+    def get_names(self):
+        return list(self.snapshots)
+
+    def recall(self, name, commit=False):
+        """Send the values of the snapshot that differ from the known device state and return them.
+
+        The values are sent as MIDI controllers to audition them or as SysEx messages if commit is True.
+        """
+        snapshot = self.snapshots[name]
+        live = self.connector.values
+        stored = self.connector.stored_values
+        delta = {}
+        for param, value in snapshot.items():
+            if live.get(param) != value or (commit and stored.get(param) != value):
+                delta[param] = value
+        logger.debug('Recalling %d parameters from snapshot %s...',
+                     len(delta), name)
+        self.connector.set_parameters(delta, persistent=commit)
+        return delta
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude step editor"""
+
+from microdude import connector
+from microdude import transform
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+FLUSH_DELAY = 0.3
+MIN_NOTE = 1
+MAX_NOTE = 0x7E
+
+
+class StepEditor(object):
+    """In memory model of the 8 sequences that only sends the fragments with changes.
+
+    Every edit is kept in an undo journal. If schedule(delay, callback) is given, the changes are
+    flushed once no step has been edited for FLUSH_DELAY. Otherwise, flush must be called.
+    """
+
+    def __init__(self, conn, schedule=None, flush_delay=FLUSH_DELAY):
+        self.connector = conn
+        self.schedule = schedule
+        self.flush_delay = flush_delay
+        self.steps = [[transform.END] * transform.SEQUENCE_LENGTH
+                      for i in range(connector.SEQUENCES)]
+        self.journal = []
+        self.dirty = set()
+        self.last_edit = 0
+        self.flush_scheduled = False
+
+    def load(self):
+        """Read all the sequences from the MicroBrute in a pipelined fashion."""
+        keys = []
+        for seq_id in range(connector.SEQUENCES):
+            for offset in connector.FRAGMENT_OFFSETS:
+                keys.append((seq_id, offset))
+        fragments = self.connector.get_sequence_fragments(keys)
+        for (seq_id, offset), fragment in zip(keys, fragments):
+            self.steps[seq_id][offset:offset +
+                               connector.FRAGMENT_LENGTH] = fragment
+        self.journal = []
+        self.dirty.clear()
+
+    def get_step(self, seq_id, step):
+        return self.steps[seq_id][step]
+
+    def get_sequence(self, seq_id):
+        """Return the sequence in Arturia's format."""
+        return self.connector.get_sequence_string(seq_id, self.steps[seq_id])
+
+    def set_step(self, seq_id, step, value):
+        """Set a step to a note, transform.REST or transform.END.
+
+        Setting a note or a rest after the end of the sequence fills the steps in between with rests.
+        Setting the end clears all the steps after it so they do not come back if the sequence grows.
+        """
+        if value not in (transform.REST, transform.END) and not MIN_NOTE <= value <= MAX_NOTE:
+            raise ValueError('Bad step value')
+        sequence = self.steps[seq_id]
+        changes = []
+        if value == transform.END:
+            for i in range(step, transform.SEQUENCE_LENGTH):
+                if sequence[i] != transform.END:
+                    changes.append((seq_id, i, sequence[i], transform.END))
+        else:
+            for i in range(step):
+                if sequence[i] == transform.END:
+                    changes.append((seq_id, i, transform.END, transform.REST))
+            if sequence[step] != value:
+                changes.append((seq_id, step, sequence[step], value))
+        if not changes:
+            return
+        self.journal.append(changes)
+        for seq_id, step, old, new in changes:
+            self.apply(seq_id, step, new)
+        self.touch()
+
+    def undo(self):
+        """Revert the last edit and return True or False if there was nothing to undo."""
+        if not self.journal:
+            return False
+        for seq_id, step, old, new in reversed(self.journal.pop()):
+            self.apply(seq_id, step, old)
+        self.touch()
+        return True
+
+    def apply(self, seq_id, step, value):
+        self.steps[seq_id][step] = value
+        self.dirty.add((seq_id, step - step % connector.FRAGMENT_LENGTH))
+
+    def touch(self):
+        self.last_edit = time.monotonic()
+        if self.schedule and not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.schedule(self.flush_delay, self.idle)
+
+    def idle(self):
+        remaining = self.last_edit + self.flush_delay - time.monotonic()
+        if remaining > 0:
+            self.schedule(remaining, self.idle)
+            return
+        self.flush_scheduled = False
+        self.flush()
+
+    def get_end(self, seq_id):
+        sequence = self.steps[seq_id]
+        if transform.END in sequence:
+            return sequence.index(transform.END)
+        return transform.SEQUENCE_LENGTH
+
+    def flush(self):
+        """Send the fragments with changes and return them.
+
+        Fragments after the end of the sequence are not sent as the end in a previous fragment
+        already makes the MicroBrute ignore them. A fragment starting at the end is sent as it holds it.
+        """
+        sent = []
+        for seq_id, offset in sorted(self.dirty):
+            self.dirty.discard((seq_id, offset))
+            if offset > self.get_end(seq_id):
+                continue
+            values = self.steps[seq_id][offset:offset +
+                                        connector.FRAGMENT_LENGTH]
+            self.connector.set_sequence_fragment(seq_id, offset, values)
+            sent.append((seq_id, offset))
+        if sent:
+            logger.debug('%d fragments sent', len(sent))
+        return sent
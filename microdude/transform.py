@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude. If not, see <http://www.gnu.org/licenses/>.
+
+"""MicroDude bulk sequence transformations"""
+
+from microdude import connector
+from array import array
+import random
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+REST = 0x7F
+END = 0x00
+MIN_NOTE = 0x01
+MAX_NOTE = 0x7E
+SEQUENCE_LENGTH = len(connector.FRAGMENT_OFFSETS) * connector.FRAGMENT_LENGTH
+
+SCALES = {
+    'chromatic': [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11],
+    'major': [0, 2, 4, 5, 7, 9, 11],
+    'minor': [0, 2, 3, 5, 7, 8, 10],
+    'harmonic_minor': [0, 2, 3, 5, 7, 8, 11],
+    'dorian': [0, 2, 3, 5, 7, 9, 10],
+    'major_pentatonic': [0, 2, 4, 7, 9],
+    'minor_pentatonic': [0, 3, 5, 7, 10],
+    'blues': [0, 3, 5, 6, 7, 10]
+}
+
+
+def clip(note):
+    return MIN_NOTE if note < MIN_NOTE else MAX_NOTE if note > MAX_NOTE else note
+
+
+def get_scale_table(scale, root=0):
+    """Return a lookup table mapping every note to the nearest note of the scale. Ties go down."""
+    degrees = set((root + d) % 12 for d in SCALES[scale])
+    table = []
+    for note in range(128):
+        for distance in range(12):
+            if (note - distance) % 12 in degrees:
+                candidate = note - distance
+                break
+            if (note + distance) % 12 in degrees:
+                candidate = note + distance
+                break
+        table.append(clip(candidate))
+    return table
+
+
+def normalize(row):
+    """Return the row with everything after the end of the sequence set to END."""
+    row = list(row)
+    if END in row:
+        end = row.index(END)
+        row[end:] = [END] * (len(row) - end)
+    return row
+
+
+def from_fragments(fragments):
+    """Return a SequenceBank from consecutive fragments as returned by Connector.get_sequence_fragment."""
+    rows = []
+    fragments = list(fragments)
+    step = len(connector.FRAGMENT_OFFSETS)
+    for i in range(0, len(fragments), step):
+        row = []
+        for fragment in fragments[i:i + step]:
+            row.extend(fragment)
+        rows.append(row)
+    return SequenceBank(rows)
+
+
+def from_steps(sequences):
+    """Return a SequenceBank from lists of steps in the 'x' and note strings format."""
+    rows = []
+    for steps in sequences:
+        row = [REST if s == 'x' else int(s) for s in steps[0:SEQUENCE_LENGTH]]
+        row.extend([END] * (SEQUENCE_LENGTH - len(row)))
+        rows.append(row)
+    return SequenceBank(rows)
+
+
+class SequenceBank(object):
+    """Packed 2-D representation of sequences with a row of 64 steps per sequence.
+
+    NumPy is used if available and array otherwise. Rests and the steps after the end of each
+    sequence are never modified by the transformations, which happen in place and return the bank.
+    """
+
+    def __init__(self, rows):
+        rows = [normalize(row) for row in rows]
+        for row in rows:
+            if len(row) != SEQUENCE_LENGTH:
+                raise ValueError('Bad sequence length')
+        self.count = len(rows)
+        if numpy:
+            self.data = numpy.array(rows, dtype=numpy.uint8).reshape(
+                self.count, SEQUENCE_LENGTH)
+        else:
+            self.data = array('B')
+            for row in rows:
+                self.data.extend(row)
+
+    def copy(self):
+        return SequenceBank(self.get_rows())
+
+    def get_rows(self):
+        if numpy:
+            return self.data.tolist()
+        return [self.data[i:i + SEQUENCE_LENGTH].tolist()
+                for i in range(0, len(self.data), SEQUENCE_LENGTH)]
+
+    def to_fragments(self):
+        """Return the fragments of all the sequences in the format used by Connector.set_sequence_fragment."""
+        fragments = []
+        for row in self.get_rows():
+            for offset in connector.FRAGMENT_OFFSETS:
+                fragments.append(row[offset:offset + connector.FRAGMENT_LENGTH])
+        return fragments
+
+    def to_steps(self):
+        """Return the steps of all the sequences in the 'x' and note strings format."""
+        sequences = []
+        for row in self.get_rows():
+            steps = []
+            for value in row:
+                if value == END:
+                    break
+                steps.append('x' if value == REST else str(value))
+            sequences.append(steps)
+        return sequences
+
+    def get_masks(self):
+        """Return the active steps and the notes masks."""
+        ends = self.data == END
+        lengths = numpy.where(ends.any(axis=1), ends.argmax(axis=1),
+                              SEQUENCE_LENGTH)
+        columns = numpy.arange(SEQUENCE_LENGTH)
+        active = columns < lengths[:, None]
+        return lengths, columns, active, active & (self.data != REST)
+
+    def map_notes(self, function):
+        """Apply function to every note in the fallback representation."""
+        data = self.data
+        for i in range(len(data)):
+            if data[i] != END and data[i] != REST:
+                data[i] = function(data[i])
+
+    def map_rows(self, function):
+        """Apply function to the active steps of every row in the fallback representation."""
+        data = self.data
+        for start in range(0, len(data), SEQUENCE_LENGTH):
+            row = data[start:start + SEQUENCE_LENGTH]
+            length = row.index(END) if END in row else SEQUENCE_LENGTH
+            if length:
+                data[start:start + length] = array('B', function(row[0:length]))
+
+    def transpose(self, semitones):
+        if numpy:
+            notes = self.get_masks()[3]
+            values = self.data[notes].astype(numpy.int16) + semitones
+            self.data[notes] = numpy.clip(values, MIN_NOTE, MAX_NOTE)
+        else:
+            self.map_notes(lambda note: clip(note + semitones))
+        return self
+
+    def invert(self, axis=60):
+        """Mirror the notes around the axis note."""
+        if numpy:
+            notes = self.get_masks()[3]
+            values = 2 * axis - self.data[notes].astype(numpy.int16)
+            self.data[notes] = numpy.clip(values, MIN_NOTE, MAX_NOTE)
+        else:
+            self.map_notes(lambda note: clip(2 * axis - note))
+        return self
+
+    def reverse(self):
+        if numpy:
+            lengths, columns, active, notes = self.get_masks()
+            indexes = numpy.where(active, lengths[:, None] - 1 - columns,
+                                  columns)
+            self.data = numpy.take_along_axis(self.data, indexes, axis=1)
+        else:
+            self.map_rows(lambda row: row[::-1])
+        return self
+
+    def rotate(self, steps):
+        """Rotate the steps of every sequence to the right within its own length."""
+        if numpy:
+            lengths, columns, active, notes = self.get_masks()
+            safe_lengths = numpy.maximum(lengths, 1)[:, None]
+            indexes = numpy.where(active, (columns - steps) % safe_lengths,
+                                  columns)
+            self.data = numpy.take_along_axis(self.data, indexes, axis=1)
+        else:
+            def rotate_row(row):
+                n = steps % len(row)
+                return row[len(row) - n:] + row[0:len(row) - n]
+            self.map_rows(rotate_row)
+        return self
+
+    def quantize(self, scale, root=0):
+        """Move every note to the nearest note of the scale in the given root."""
+        table = get_scale_table(scale, root)
+        if numpy:
+            notes = self.get_masks()[3]
+            lookup = numpy.array(table, dtype=numpy.uint8)
+            self.data[notes] = lookup[self.data[notes]]
+        else:
+            self.map_notes(lambda note: table[note])
+        return self
+
+    def randomize(self, amount, probability=1.0, seed=None):
+        """Move the notes randomly up to amount semitones with the given probability."""
+        if numpy:
+            notes = self.get_masks()[3]
+            generator = numpy.random.default_rng(seed)
+            count = int(notes.sum())
+            offsets = generator.integers(-amount, amount + 1, count)
+            offsets[generator.random(count) >= probability] = 0
+            values = self.data[notes].astype(numpy.int16) + offsets
+            self.data[notes] = numpy.clip(values, MIN_NOTE, MAX_NOTE)
+        else:
+            generator = random.Random(seed)
+
+            def randomize_note(note):
+                if generator.random() >= probability:
+                    return note
+                return clip(note + generator.randint(-amount, amount))
+            self.map_notes(randomize_note)
+        return self
@@ -19,8 +19,11 @@
 
 """MicroDude utils"""
 
-from microdude import connector
+import copy
 import json
+import os
+import tempfile
+import threading
 from os import makedirs
 from os.path import expanduser
 from os.path import exists
@@ -32,58 +35,153 @@ APP_NAME = 'microdude'
 READ_ERROR_MSG = 'Config file could not be read: {:s}. Using default configuration...'
 OPEN_ERROR_MSG = 'Config file could not be opened: {:s}.'
 CREATE_ERROR_MSG = 'Config file could not be created {:s}.'
+WRITE_ERROR_MSG = 'File could not be written: {:s}. Skipping...'
 DEVICE = 'device'
 PERSISTENT = 'persistent'
-DEFAULT_CONFIG = {DEVICE: '', PERSISTENT: True}
+BACKEND = 'backend'
+DEVICES = 'devices'
+DEFAULT_DEVICE_CONFIG = {PERSISTENT: True, BACKEND: ''}
+DEFAULT_CONFIG = {DEVICE: '', PERSISTENT: True, BACKEND: '', DEVICES: {}}
+DEBOUNCE_TIME = 0.5
 
 CONFIG_DIR = expanduser('~') + '/.' + APP_NAME
 CONFIG_FILE = CONFIG_DIR + '/config'
 
+config = None
+
+
+def write_atomically(filename, content):
+    """Write the content to a temporary file and rename it so that the file is never left half written."""
+    directory = os.path.dirname(filename)
+    makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + APP_NAME)
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, filename)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
 
 def create_config():
-    if not exists(CONFIG_DIR):
-        logger.debug('Writing config dir...')
+    if not exists(CONFIG_FILE):
+        logger.debug('Creating config file...')
         try:
-            makedirs(CONFIG_DIR)
+            write_atomically(CONFIG_FILE, json.dumps(DEFAULT_CONFIG))
         except IOError as e:
-            logger.error(CREATE_ERROR_MSG.format(e))
+            logger.error(CREATE_ERROR_MSG.format(str(e)))
 
-    if not exists(CONFIG_FILE):
-        logger.debug('Creating config file...')
-        with open(CONFIG_FILE, 'w') as file:
-            try:
-                file.write(json.dumps(DEFAULT_CONFIG))
-            except IOError as e:
-                logger.error(CREATE_ERROR_MSG.format(e))
 
+class Config(object):
+    """Configuration kept in memory and written to disk DEBOUNCE_TIME after the last change.
 
-def read_config():
-    logger.debug('Reading config file...')
-    try:
-        file = open(CONFIG_FILE, 'r')
-    except IOError as e:
-        logger.error(OPEN_ERROR_MSG.format(str(e)))
-        return DEFAULT_CONFIG
-    else:
+    Settings that depend on the device are kept in a section per device and
+    fall back to the global value if the device has none.
+    """
+
+    def __init__(self, filename=CONFIG_FILE, debounce_time=DEBOUNCE_TIME):
+        self.filename = filename
+        self.debounce_time = debounce_time
+        self.lock = threading.RLock()
+        self.timer = None
+        self.data = self.load()
+
+    def load(self):
+        logger.debug('Reading config file...')
+        data = copy.deepcopy(DEFAULT_CONFIG)
         try:
-            config = json.loads(file.read())
-            if config.get(PERSISTENT) == None:
-                config[PERSISTENT] = True
-        except (IOError, ValueError) as e:
+            with open(self.filename, 'r') as file:
+                loaded = json.loads(file.read())
+            if not isinstance(loaded, dict):
+                raise ValueError('Bad format')
+        except FileNotFoundError as e:
+            logger.debug(OPEN_ERROR_MSG.format(str(e)))
+        except IOError as e:
+            logger.error(OPEN_ERROR_MSG.format(str(e)))
+        except ValueError as e:
             logger.error(READ_ERROR_MSG.format(str(e)))
         else:
+            data.update(loaded)
+            if data.get(PERSISTENT) == None:
+                data[PERSISTENT] = True
+            if not isinstance(data.get(DEVICES), dict):
+                data[DEVICES] = {}
             logger.debug('Config file read.')
-        file.close()
-        return config
+        return data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.schedule_write()
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def get_device_value(self, key, device=None):
+        """Return the value for the given device, the current one by default, or the global value."""
+        if device is None:
+            device = self.data[DEVICE]
+        section = self.data[DEVICES].get(device, {})
+        if key in section:
+            return section[key]
+        return self.data.get(key, DEFAULT_DEVICE_CONFIG.get(key))
+
+    def set_device_value(self, key, value, device=None):
+        """Set the value for the given device or the current one by default."""
+        with self.lock:
+            if device is None:
+                device = self.data[DEVICE]
+            self.data[DEVICES].setdefault(device, {})[key] = value
+            self.schedule_write()
+
+    def rename_device(self, old, new):
+        """Move the settings of a device to a new name and select it if it was the current one."""
+        with self.lock:
+            if old in self.data[DEVICES]:
+                self.data[DEVICES].setdefault(
+                    new, {}).update(self.data[DEVICES].pop(old))
+            if self.data[DEVICE] == old:
+                self.data[DEVICE] = new
+            self.schedule_write()
+
+    def schedule_write(self):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.debounce_time, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """Write the configuration now if there are pending changes."""
+        with self.lock:
+            if not self.timer:
+                return
+            self.timer.cancel()
+            self.timer = None
+            logger.debug('Writing config file...')
+            logger.debug('Configuration: {:s}'.format(str(self.data)))
+            try:
+                write_atomically(self.filename, json.dumps(self.data))
+                logger.debug('Config file written.')
+            except IOError as e:
+                logger.error(WRITE_ERROR_MSG.format(str(e)))
+
+
+def read_config():
+    """Return the configuration, which is only read from disk the first time."""
+    global config
+    if config is None:
+        config = Config()
+    return config
 
 
 def write_config(config):
-    logger.debug('Writing config file...')
-    logger.debug('Configuration: {:s}'.format(str(config)))
-    with open(CONFIG_FILE, 'w') as file:
-        try:
-            file.write(json.dumps(config))
-            logger.debug('Config file written.')
-        except IOError as e:
-            logger.error(
-                'File could not be written: {:s}. Skipping...'.format(str(e)))
+    """Write the pending changes of the configuration now."""
+    config.flush()
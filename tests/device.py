@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+from mido import Message
+from microdude import connector
+from microdude.connector import Connector
+
+RX_MSG = [0x0, 0x20, 0x6B, 0x5, 0x1]
+VERSION = [1, 0, 0, 8]
+
+
+class FakeDevice(object):
+    """Port emulating the SysEx interface of a MicroBrute"""
+
+    def __init__(self):
+        self.parameters = dict((p, 0) for p in connector.PARAMETERS)
+        self.steps = [[0] * 64 for i in range(connector.SEQUENCES)]
+        self.pending = []
+        self.sent = []
+        self.closed = False
+
+    def send(self, msg):
+        self.sent.append(msg)
+        if msg.type != 'sysex':
+            return
+        data = list(msg.data)
+        if data == connector.INQUIRY_REQ:
+            self.pending.append(Message(
+                'sysex', data=connector.INQUIRY_RES_WO_VERSION + VERSION))
+            return
+        seq = data[5]
+        if data[6] == 0:
+            param = data[7] - 1
+            self.reply(seq, [1, param, self.parameters[param]])
+        elif data[6] == 1:
+            self.parameters[data[7]] = data[8]
+        elif data[6] == 0x03:
+            seq_id, offset = data[8], data[9]
+            self.reply(seq, [0x23, 0x3A, seq_id, offset, 0x20] +
+                       self.steps[seq_id][offset:offset + 0x20])
+        elif data[6] == 0x23:
+            seq_id, offset = data[8], data[9]
+            self.steps[seq_id][offset:offset + 0x20] = data[11:43]
+
+    def reply(self, seq, data):
+        self.pending.append(Message('sysex', data=RX_MSG + [seq] + data))
+
+    def iter_pending(self):
+        while self.pending:
+            yield self.pending.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+def create_connector(device=None, port_factory=None):
+    """Return a Connector using the given port, or one from the factory, without handshaking."""
+    c = Connector(port_factory)
+    c.port = device if device is not None else port_factory('')
+    return c
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from microdude import backup
+from microdude.backup import SequenceBackup
+from microdude.connector import ConnectorError
+from tests.device import FakeDevice
+from tests.device import create_connector
+
+
+class FailingDevice(FakeDevice):
+    """Device failing after answering some fragment requests"""
+
+    def __init__(self, fragments):
+        super().__init__()
+        self.fragments = fragments
+
+    def send(self, msg):
+        if msg.data[6] == 0x03:
+            if not self.fragments:
+                raise IOError()
+            self.fragments -= 1
+        super().send(msg)
+
+
+class TestBackup(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'sequences.mbseq')
+        self.max_journal_age = backup.MAX_JOURNAL_AGE
+
+    def tearDown(self):
+        backup.MAX_JOURNAL_AGE = self.max_journal_age
+        self.dir.cleanup()
+
+    def run_backup(self, device, name='MicroBrute'):
+        device.steps[2][0:3] = [36, 0x7F, 48]
+        c = create_connector(device)
+        c.sw_version = '1.0.0.8'
+        SequenceBackup(c, self.filename, name).run()
+        return len([m for m in device.sent if m.data[6] == 0x03])
+
+    def fail_backup(self):
+        with self.assertRaises(ConnectorError):
+            self.run_backup(FailingDevice(5))
+        self.assertTrue(os.path.exists(self.filename + backup.JOURNAL_EXTENSION))
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_resume(self):
+        self.fail_backup()
+        self.assertTrue(self.run_backup(FakeDevice()) == 11)
+        with open(self.filename, 'r', newline='') as file:
+            sequences = file.read().split('\r\n')
+        self.assertTrue(len(sequences) == 8)
+        self.assertTrue(sequences[2] == '3:36 x 48')
+
+    def test_other_device(self):
+        self.fail_backup()
+        self.assertTrue(self.run_backup(FakeDevice(), 'MicroBrute #2') == 16)
+
+    def test_stale_journal(self):
+        self.fail_backup()
+        backup.MAX_JOURNAL_AGE = -1
+        self.assertTrue(self.run_backup(FakeDevice()) == 16)
+
+    def test_finish(self):
+        self.assertTrue(self.run_backup(FakeDevice()) == 16)
+        self.assertTrue(os.listdir(self.dir.name) == ['sequences.mbseq'])
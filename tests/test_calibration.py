@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from microdude import calibration
+from microdude import connector
+from tests.device import FakeDevice
+from tests.device import create_connector
+
+CALIB_PARAMS = [connector.CALIB_PB_CENTER, connector.CALIB_BOTH_BOTTOM,
+                connector.CALIB_BOTH_TOP, connector.CALIB_END]
+
+
+class BrokenDevice(FakeDevice):
+
+    def send(self, msg):
+        raise IOError()
+
+
+class SilentDevice(FakeDevice):
+    """Device not answering the first requests"""
+
+    def __init__(self, silent):
+        super().__init__()
+        self.silent = silent
+
+    def send(self, msg):
+        super().send(msg)
+        if self.silent and msg.data[6] == 0:
+            self.silent -= 1
+            self.pending.clear()
+
+
+class TestCalibration(unittest.TestCase):
+
+    def setUp(self):
+        self.end_delay = calibration.END_DELAY
+        self.retry_delay = calibration.RETRY_DELAY
+        calibration.END_DELAY = 0
+        calibration.RETRY_DELAY = 0
+
+    def tearDown(self):
+        calibration.END_DELAY = self.end_delay
+        calibration.RETRY_DELAY = self.retry_delay
+
+    def test_step_is_scheduled(self):
+        scheduled = []
+        c = calibration.Calibration(create_connector(FakeDevice()),
+                                    lambda delay, callback: scheduled.append((delay, callback)))
+        c.step(calibration.BOTH_TOP)
+        self.assertTrue(len(scheduled) == 1)
+        # Write and confirmation
+        scheduled.pop()[1]()
+        scheduled.pop()[1]()
+        self.assertTrue(scheduled[0][0] == calibration.END_DELAY)
+        scheduled.pop()[1]()
+        scheduled.pop()[1]()
+        scheduled.pop()[1]()
+        self.assertTrue(c.state == calibration.DONE)
+
+    def test_calibrate(self):
+        devices = [FakeDevice(), FakeDevice()]
+        states = []
+        actual = calibration.calibrate_all(
+            [create_connector(d) for d in devices], states.append)
+        self.assertTrue(actual == [True, True])
+        self.assertTrue(states == calibration.USER_STEPS)
+        for device in devices:
+            sent = [m.data[7] for m in device.sent if m.data[6] == 1]
+            self.assertTrue(sent == CALIB_PARAMS)
+
+    def test_calibrate_failure(self):
+        states = []
+        c = calibration.Calibration(
+            create_connector(BrokenDevice()), listener=states.append)
+        c.step(calibration.PB_CENTER)
+        self.assertTrue(states == [calibration.PB_CENTER, calibration.FAILED])
+
+    def test_calibrate_retry(self):
+        device = SilentDevice(calibration.CONFIRM_POLLS)
+        scheduled = []
+        c = calibration.Calibration(create_connector(device),
+                                    lambda delay, callback: scheduled.append((delay, callback)))
+        c.step(calibration.PB_CENTER)
+        while scheduled:
+            scheduled.pop(0)[1]()
+        self.assertTrue(c.attempts == 1)
+        self.assertTrue(c.state == calibration.PB_CENTER)
+        sent = [m.data[7] for m in device.sent if m.data[6] == 1]
+        self.assertTrue(sent == [connector.CALIB_PB_CENTER] * 2)
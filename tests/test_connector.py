@@ -19,7 +19,9 @@
 
 import unittest
 import microdude
+from microdude import connector
 from microdude.connector import Connector
+from tests.device import FakeDevice
 
 SYSEX_SEQUENCE_FRAGMENT1 = [0x00, 0x20, 0x6B, 0x05, 0x01, 0x47, 0x23, 0x3A, 0x01, 0x00, 0x20, 0x28, 0x34, 0x40, 0x4C, 0x40, 0x34, 0x2C, 0x38,
                             0x44, 0x50, 0x44, 0x38, 0x32, 0x3E, 0x4A, 0x56, 0x4A, 0x3E, 0x34, 0x40, 0x4C, 0x58, 0x4C, 0x40, 0x30, 0x3C, 0x48, 0x54, 0x48, 0x3C, 0x37, 0x43]
@@ -114,3 +116,146 @@ class TestConnector(unittest.TestCase):
             self.assertTrue(False)
         except ValueError as e:
             self.assertTrue(str(e) == microdude.connector.SEQ_FILE_ERROR)
+
+    def test_get_parameters(self):
+        self.connector.port = FakeDevice()
+        self.connector.port.parameters[microdude.connector.BEND_RANGE] = 12
+        self.connector.seq = 0x7E
+        actual = self.connector.get_parameters(microdude.connector.PARAMETERS)
+        self.assertTrue(actual[microdude.connector.BEND_RANGE] == 12)
+        self.assertTrue(self.connector.seq == 12)
+
+    def test_get_sequence_fragments(self):
+        self.connector.port = FakeDevice()
+        self.connector.port.steps[2][0x20] = 48
+        actual = self.connector.get_sequence_fragments([(2, 0), (2, 0x20)])
+        self.assertTrue(actual[0] == [0] * 0x20)
+        self.assertTrue(actual[1] == [48] + [0] * 0x1F)
+
+    def test_trace(self):
+        self.connector = Connector(trace_size=2)
+        self.connector.port = FakeDevice()
+        self.connector.get_parameter(microdude.connector.SYNC)
+        self.connector.seq = 0x1
+        self.connector.set_parameter(microdude.connector.NOTE_PRIORITY, 0)
+        self.assertTrue(len(self.connector.trace) == 2)
+        self.assertTrue(self.connector.trace[0][1] == microdude.connector.RX)
+        self.assertTrue(self.connector.trace[1][2] == SYSEX_SET_MESSAGE)
+        with self.assertLogs('microdude.connector', 'ERROR') as logs:
+            self.connector.dump_trace()
+        self.assertTrue(logs.output[-1].endswith(
+            '+0.000 s tx 00 20 6b 05 01 01 01 0b 00'))
+
+    def test_trace_not_dumped_on_timeout(self):
+        self.connector = Connector(trace_size=2)
+        device = FakeDevice()
+        device.send = lambda msg: None
+        self.connector.port = device
+        dumps = []
+        self.connector.dump_trace = lambda: dumps.append(True)
+        with self.assertRaises(microdude.connector.ConnectorError):
+            self.connector.get_parameter(microdude.connector.SYNC, 1)
+        self.assertTrue(dumps == [])
+
+    def test_trace_disabled(self):
+        self.connector.port = FakeDevice()
+        self.connector.get_parameter(microdude.connector.SYNC)
+        self.assertTrue(self.connector.trace is None)
+
+    def test_connect(self):
+        device = FakeDevice()
+        device.parameters[microdude.connector.RX_CHANNEL] = 3
+        self.connector = Connector(lambda name: device)
+        self.connector.connect('MicroBrute')
+        self.assertTrue(self.connector.sw_version == '1.0.0.8')
+        self.assertTrue(len(device.sent) == 1)
+        self.connector.set_parameter(microdude.connector.SYNC, 1, False)
+        self.assertTrue(device.sent[-1].channel == 3)
+
+    def test_reconnect_keeps_channel(self):
+        devices = []
+        self.connector = Connector(
+            lambda name: devices.append(FakeDevice()) or devices[-1])
+        self.connector.connect('MicroBrute')
+        self.connector.set_parameter(microdude.connector.RX_CHANNEL, 3, False)
+        self.connector.disconnect()
+        self.connector.connect('MicroBrute')
+        self.connector.set_parameter(microdude.connector.SYNC, 1, False)
+        self.assertTrue([m.type for m in devices[-1].sent] == [
+                        'sysex', 'control_change'])
+        self.assertTrue(devices[-1].sent[-1].channel == 3)
+        self.connector.connect('MicroBrute 2')
+        self.assertTrue(self.connector.channel is None)
+
+    def test_resume(self):
+        devices = []
+        self.connector = Connector(
+            lambda name: devices.append(FakeDevice()) or devices[-1])
+        self.connector.connect('MicroBrute')
+        self.assertTrue(self.connector.resume('MicroBrute'))
+        self.assertTrue(len(devices) == 1)
+        self.assertFalse(self.connector.resume('MicroBrute 2'))
+        self.assertTrue(len(devices) == 2)
+        self.assertTrue(devices[0].closed)
+
+    def test_set_parameters_verify(self):
+        device = FakeDevice()
+        lost = []
+
+        def send(msg, send=device.send):
+            # The first write of SYNC is lost
+            if msg.data[6] == 1 and msg.data[7] == microdude.connector.SYNC and not lost:
+                lost.append(msg)
+                return
+            send(msg)
+        device.send = send
+        self.connector.port = device
+        values = {microdude.connector.SYNC: 2,
+                  microdude.connector.BEND_RANGE: 12}
+        actual = self.connector.set_parameters(values, True)
+        self.assertTrue(actual[microdude.connector.FAILED] == [])
+        self.assertTrue(sorted(actual[microdude.connector.CONFIRMED]) == sorted(values))
+        self.assertTrue(device.parameters[microdude.connector.SYNC] == 2)
+        self.assertTrue(len(lost) == 1)
+
+    def test_set_sequences_verify(self):
+        device = FakeDevice()
+        device.send = lambda msg, send=device.send: None if msg.data[6] == 0x23 and msg.data[9] else send(msg)
+        self.connector.port = device
+        actual = self.connector.set_sequences([STRING_SEQUENCE], True)
+        self.assertTrue(actual[microdude.connector.CONFIRMED] == [(1, 0)])
+        self.assertTrue(actual[microdude.connector.FAILED] == [(1, 0x20)])
+
+    def test_backend_change(self):
+        c = Connector()
+        device = FakeDevice()
+        open_ioport = connector.mido.open_ioport
+        connector.mido.open_ioport = lambda name: device
+        try:
+            c.connect('MicroBrute')
+        finally:
+            connector.mido.open_ioport = open_ioport
+        self.assertTrue(c.port is device)
+        self.assertTrue(c.sw_version == '1.0.0.8')
+
+    def test_late_response(self):
+        device = FakeDevice()
+        device.parameters[connector.SYNC] = 2
+        device.parameters[connector.BEND_RANGE] = 12
+        self.connector.port = device
+        late = []
+
+        def send(msg, send=device.send):
+            send(msg)
+            # The response to SYNC arrives after the timeout
+            if msg.data[7] == connector.SYNC + 1:
+                late.extend(device.pending)
+                device.pending.clear()
+        device.send = send
+        with self.assertRaises(connector.ConnectorError):
+            self.connector.get_parameter(connector.SYNC, 1)
+        device.pending.extend(late)
+        self.assertTrue(self.connector.get_parameter(connector.BEND_RANGE) == 12)
+        device.pending.extend(late)
+        self.assertTrue(self.connector.get_parameters(
+            [connector.BEND_RANGE]) == {connector.BEND_RANGE: 12})
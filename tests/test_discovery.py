@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from microdude.discovery import Discovery
+from microdude import discovery
+from tests.device import FakeDevice
+
+
+class SilentPort(FakeDevice):
+    """Port that never answers"""
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+class TestDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        self.ports = {
+            'MicroBrute:MicroBrute MIDI 1 28:0': FakeDevice(),
+            'MicroBrute:MicroBrute MIDI 1 100:0': FakeDevice(),
+            'MicroBrute:MicroBrute MIDI 1 24:0': FakeDevice(),
+            'Other MicroBrute 32:0': SilentPort()
+        }
+        self.discovery = Discovery(
+            lambda name: self.ports[name], lambda: list(self.ports))
+
+    def test_get_port_key(self):
+        self.assertTrue(discovery.get_port_key(
+            'MicroBrute:MicroBrute MIDI 1 24:0') == 'MicroBrute:MicroBrute MIDI 1')
+        self.assertTrue(discovery.get_port_key('MicroBrute') == 'MicroBrute')
+
+    def test_scan(self):
+        ports = self.discovery.scan(0.05)
+        self.assertTrue(ports == {
+            'MicroBrute:MicroBrute MIDI 1': 'MicroBrute:MicroBrute MIDI 1 24:0',
+            'MicroBrute:MicroBrute MIDI 1 #2': 'MicroBrute:MicroBrute MIDI 1 28:0',
+            'MicroBrute:MicroBrute MIDI 1 #3': 'MicroBrute:MicroBrute MIDI 1 100:0'
+        })
+        self.assertTrue(self.discovery.versions[
+            'MicroBrute:MicroBrute MIDI 1'] == '1.0.0.8')
+        for port in self.ports.values():
+            self.assertTrue(len(port.sent) == 1)
+            self.assertTrue(port.closed)
+
+    def test_stable_identity(self):
+        self.discovery.scan(0.05)
+        self.ports['MicroBrute:MicroBrute MIDI 1 20:0'] = self.ports.pop(
+            'MicroBrute:MicroBrute MIDI 1 24:0')
+        self.discovery.scan(0.05)
+        self.assertTrue(self.discovery.get_port(
+            'MicroBrute:MicroBrute MIDI 1') == 'MicroBrute:MicroBrute MIDI 1 20:0')
+        self.assertTrue(self.discovery.get_identity(
+            'MicroBrute:MicroBrute MIDI 1 100:0') == 'MicroBrute:MicroBrute MIDI 1 #3')
+
+    def test_known_ports(self):
+        port = 'MicroBrute:MicroBrute MIDI 1 24:0'
+        ports = self.discovery.scan(0.05, {port: '1.0.0.7'})
+        self.assertTrue(len(ports) == 3)
+        self.assertTrue(self.ports[port].sent == [])
+        self.assertFalse(self.ports[port].closed)
+        self.assertTrue(self.discovery.versions[
+            'MicroBrute:MicroBrute MIDI 1'] == '1.0.0.7')
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import struct
+import unittest
+import zlib
+from microdude import connector
+from microdude import image
+from microdude.image import DeviceImage
+from tests.device import FakeDevice
+from tests.device import create_connector
+
+
+class TestImage(unittest.TestCase):
+
+    def setUp(self):
+        self.source = FakeDevice()
+        self.source.parameters[connector.BEND_RANGE] = 12
+        self.source.parameters[connector.SYNC] = 2
+        self.source.steps[3][0:5] = [36, 0x7F, 48, 0, 50]
+        self.source.steps[5][0:40] = [60] * 40
+        self.target = FakeDevice()
+        self.target.steps[5][0:40] = [60] * 40
+
+    def test_normalize_steps(self):
+        steps = bytes([36, 0, 40] + [0] * 61) * 8
+        actual = image.normalize_steps(steps)
+        self.assertTrue(actual == bytes([36] + [0] * 63) * 8)
+
+    def test_to_bytes_and_from_bytes(self):
+        expected = image.capture(create_connector(self.source))
+        actual = image.from_bytes(expected.to_bytes())
+        self.assertTrue(actual.parameters == expected.parameters)
+        self.assertTrue(actual.steps == expected.steps)
+        self.assertTrue(len(actual.parameters) == 14)
+
+    def test_from_bytes_bad_checksum(self):
+        data = bytearray(DeviceImage({}, bytes(512)).to_bytes())
+        data[8] = 1
+        with self.assertRaises(ValueError):
+            image.from_bytes(bytes(data))
+
+    def test_from_bytes_bad_value(self):
+        data = bytearray(DeviceImage({}, bytes(512)).to_bytes()[:-4])
+        data[10] = 0x80
+        data.extend(struct.pack('<I', zlib.crc32(data)))
+        with self.assertRaises(ValueError):
+            image.from_bytes(bytes(data))
+
+    def test_from_bytes_bad_parameter(self):
+        data = DeviceImage({connector.CALIB_PB_CENTER: 0}, bytes(512)).to_bytes()
+        with self.assertRaises(ValueError):
+            image.from_bytes(data)
+
+    def test_restore_shorter_sequence(self):
+        self.target.steps[5][0:40] = [60] * 40
+        self.source.steps[5][0:40] = [60] * 10 + [0] * 30
+        summary = image.clone(create_connector(self.source),
+                              create_connector(self.target))
+        self.assertTrue((5, 0) in summary[image.SENT])
+        self.assertFalse((5, 0x20) in summary[image.SENT])
+
+    def test_clone(self):
+        summary = image.clone(create_connector(self.source),
+                              create_connector(self.target))
+        self.assertTrue(len(summary[image.SENT]) == 3)
+        self.assertTrue(summary[connector.CONFIRMED] == [])
+        self.assertTrue(self.target.parameters == self.source.parameters)
+        self.assertTrue(self.target.steps[3][0:3] == [36, 0x7F, 48])
+
+    def test_clone_verify(self):
+        actual = image.clone(create_connector(self.source),
+                             create_connector(self.target), True)
+        self.assertTrue(len(actual[connector.CONFIRMED]) == 3)
+        self.assertTrue(actual[connector.FAILED] == [])
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from microdude import latency
+from microdude import utils
+from microdude.discovery import Discovery
+from tests.device import FakeDevice
+
+
+class TestLatency(unittest.TestCase):
+
+    def test_measure(self):
+        times, lost = latency.measure(FakeDevice(), 5)
+        self.assertTrue(len(times) == 5)
+        self.assertTrue(lost == 0)
+        stats = latency.get_stats(times, lost)
+        self.assertTrue(stats[latency.MIN] <= stats[latency.MEAN] <= stats[latency.MAX])
+
+    def test_get_fastest(self):
+        results = {
+            'a': latency.get_stats([0.003, 0.005], 0),
+            'b': latency.get_stats([0.001], 1),
+            'c': latency.get_stats([0.002, 0.002], 0)
+        }
+        self.assertTrue(latency.get_fastest(results) == 'c')
+        self.assertTrue(latency.get_fastest({}) is None)
+
+    def test_find_port(self):
+        class Backend(object):
+            def get_ioport_names(self):
+                return ['Midi Through 14:0', 'MicroBrute:MicroBrute MIDI 1 24:0']
+        backend = Backend()
+        self.assertTrue(latency.find_port(backend, '') is None)
+        self.assertTrue(latency.find_port(
+            backend, 'MicroBrute MIDI 1') == 'MicroBrute:MicroBrute MIDI 1 24:0')
+
+    def test_choose_backend(self):
+        port = 'MicroBrute:MicroBrute MIDI 1 24:0'
+        discovery = Discovery(lambda name: FakeDevice(), lambda: [port])
+        probe = latency.probe
+        latency.probe = lambda device, rounds: {
+            'a': latency.get_stats([0.001], 0)} if device == port else {}
+        with tempfile.TemporaryDirectory() as directory:
+            utils.config = utils.Config(os.path.join(directory, 'config'))
+            try:
+                fastest, results = latency.choose_backend(port, 1, discovery)
+                self.assertTrue(fastest == 'a')
+                self.assertTrue(utils.config.get_device_value(
+                    utils.BACKEND, 'MicroBrute:MicroBrute MIDI 1') == 'a')
+            finally:
+                latency.probe = probe
+                utils.config = None
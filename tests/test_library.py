@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from microdude import library
+from microdude.library import Library
+
+SEQUENCES = '1:36 x x 36 x x 36 x\r\n2:48 50 52 x\r\n3:36 x x 36 x x 36 x'
+
+
+class TestLibrary(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.library = Library(os.path.join(self.dir.name, 'library'))
+        self.mbseq = os.path.join(self.dir.name, 'in.mbseq')
+        with open(self.mbseq, 'w') as file:
+            file.write(SEQUENCES)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_parse_sequence_string(self):
+        actual = library.parse_sequence_string('7:36 x 39\r\n')
+        self.assertTrue(actual == (6, ['36', 'x', '39']))
+
+    def test_parse_sequence_string_bad_data(self):
+        with self.assertRaises(ValueError):
+            library.parse_sequence_string('5: a')
+        with self.assertRaises(ValueError):
+            library.parse_sequence_string('5:36 200')
+        with self.assertRaises(ValueError):
+            library.parse_sequence_string('5:0 36')
+        with self.assertRaises(ValueError):
+            library.parse_sequence_string('0:36')
+        with self.assertRaises(ValueError):
+            library.parse_sequence_string('9:36')
+        with self.assertRaises(ValueError):
+            self.library.add(['36', '127'])
+
+    def test_import_dedup(self):
+        hashes = self.library.import_file(self.mbseq, 'unit1', '2018-01-01')
+        self.assertTrue(len(hashes) == 3)
+        self.assertTrue(hashes[0] == hashes[2])
+        self.assertTrue(len(self.library.sequences) == 2)
+        self.assertTrue(len(self.library.get_sources(hashes[0])) == 2)
+
+    def test_search(self):
+        self.library.import_file(self.mbseq, 'unit1', '2018-01-01')
+        h = self.library.add(['60', 'x'], 'unit2', '2018-02-01')
+        self.assertTrue(self.library.search(device='unit2') == {h})
+        self.assertTrue(self.library.search(length=2) == {h})
+        self.assertTrue(self.library.search(date_from='2018-01-15') == {h})
+        self.assertTrue(len(self.library.search(date_to='2018-01-01')) == 2)
+        self.assertTrue(self.library.search(low=49, high=60) == {h})
+        self.assertTrue(self.library.search(low=61) == set())
+        self.assertTrue(h in self.library.search(high=60))
+        self.library.add(['x', 'x'], 'unit2', '2018-02-01')
+        self.assertTrue(self.library.search(low=49, high=60) == {h})
+        self.assertTrue(self.library.search(device='unit2', high=127) == {h})
+        self.assertTrue(len(self.library.search(device='unit2')) == 2)
+
+    def test_save_and_load(self):
+        hashes = self.library.import_file(self.mbseq, 'unit1', '2018-01-01')
+        self.library.save()
+        loaded = Library(self.library.filename)
+        self.assertTrue(loaded.search(device='unit1') == set(hashes))
+
+    def test_export_file(self):
+        h = self.library.add(['48', '50', 'x'])
+        filename = os.path.join(self.dir.name, 'out.mbseq')
+        self.library.export_file([h, h], filename)
+        with open(filename, 'r', newline='') as file:
+            self.assertTrue(file.read() == '1:48 50 x\r\n2:48 50 x')
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import time
+import unittest
+from microdude.profiler import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_wrap(self):
+        profiler = Profiler()
+        handler = profiler.wrap('button::clicked', lambda value: value + 1)
+        self.assertTrue(handler(1) == 2)
+        self.assertTrue(handler(2) == 3)
+        count, total, maximum = profiler.timings['button::clicked']
+        self.assertTrue(count == 2)
+        self.assertTrue(profiler.calls == [])
+
+    def test_instrument(self):
+        class Device(object):
+            def ping(self):
+                return True
+        device = Device()
+        profiler = Profiler()
+        profiler.instrument(device, ['ping'], 'Device')
+        self.assertTrue(device.ping())
+        self.assertTrue(profiler.timings['Device.ping'][0] == 1)
+
+    def test_stall(self):
+        profiler = Profiler(0.01)
+        profiler.beat()
+
+        def blocking():
+            time.sleep(0.05)
+            profiler.check()
+        profiler.wrap('button::clicked', blocking)()
+        profiler.beat()
+        self.assertTrue(len(profiler.stalls) == 1)
+        stall = profiler.stalls[0]
+        self.assertTrue(stall.calls == ['button::clicked'])
+        self.assertTrue(stall.duration >= 0.05)
+        self.assertTrue(any('blocking' in line for line in stall.stack))
+        output = io.StringIO()
+        profiler.write_summary(output)
+        self.assertTrue('Stall of' in output.getvalue())
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from microdude import connector
+from microdude import recorder
+from microdude.connector import Connector
+from tests.device import FakeDevice
+from tests.device import create_connector
+
+
+class TestRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'session.mbtrace')
+        self.device = FakeDevice()
+        self.device.parameters[connector.BEND_RANGE] = 7
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def record_session(self):
+        c = create_connector(port_factory=recorder.get_recording_factory(
+            self.filename, lambda device: self.device))
+        c.channel = 0
+        c.get_parameters(connector.PARAMETERS)
+        c.set_parameter(connector.SYNC, 1, False)
+        c.disconnect()
+        c.port_factory.close()
+
+    def test_record(self):
+        self.record_session()
+        records = list(recorder.read_trace(self.filename))
+        self.assertTrue(len(records) == 29)
+        self.assertTrue(records[-1][0] == recorder.TX)
+        self.assertTrue(records[-1][2].type == 'control_change')
+        times = [r[1] for r in records]
+        self.assertTrue(times == sorted(times))
+
+    def test_replay(self):
+        self.record_session()
+        c = create_connector(
+            port_factory=recorder.get_replay_factory(self.filename, False))
+        values = c.get_parameters(connector.PARAMETERS)
+        self.assertTrue(values[connector.BEND_RANGE] == 7)
+        self.assertTrue(c.port.mismatches == 0)
+
+    def test_reconnect(self):
+        factory = recorder.get_recording_factory(
+            self.filename, lambda device: self.device)
+        c = Connector(factory)
+        c.connect('MicroBrute')
+        c.get_parameter(connector.BEND_RANGE)
+        c.disconnect()
+        c.connect('MicroBrute')
+        # Records are available before the factory is closed
+        records = list(recorder.read_trace(self.filename))
+        self.assertTrue(len(records) == 6)
+        factory.close()
+        c = Connector(recorder.get_replay_factory(self.filename, False))
+        c.connect('MicroBrute')
+        self.assertTrue(c.get_parameter(connector.BEND_RANGE) == 7)
+        c.disconnect()
+        c.connect('MicroBrute')
+        self.assertTrue(c.sw_version == '1.0.0.8')
+        self.assertTrue(c.port.mismatches == 0)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+import mido
+from microdude import smf
+
+SEQUENCE = '3:36 x x 36 x 48 x 39'
+
+
+class TestSmf(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'seq.mid')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_write_and_read_sequence(self):
+        smf.write_sequence(SEQUENCE, self.filename, step_length=8)
+        actual = smf.read_sequence(self.filename, 2, step_length=8)
+        self.assertTrue(actual == SEQUENCE)
+
+    def test_trailing_rests(self):
+        smf.write_sequence('1:36 x 48 x x', self.filename)
+        actual = smf.read_sequence(self.filename)
+        self.assertTrue(actual == '1:36 x 48 x x')
+
+    def test_write_sequence_is_valid(self):
+        smf.write_sequence(SEQUENCE, self.filename)
+        notes = [m.note for m in mido.MidiFile(self.filename)
+                 if m.type == 'note_on']
+        self.assertTrue(notes == [36, 36, 48, 39])
+
+    def test_read_sequence_multitrack(self):
+        midi = mido.MidiFile(ticks_per_beat=480)
+        first = mido.MidiTrack()
+        first.append(mido.MetaMessage('set_tempo', tempo=400000))
+        first.append(mido.Message('note_on', note=40, velocity=90, time=10))
+        first.append(mido.Message('note_on', note=40, velocity=0, time=100))
+        first.append(mido.Message('program_change', program=3, time=0))
+        first.append(mido.Message('note_on', note=43, velocity=90,
+                                  time=500 + 480 * 64))
+        second = mido.MidiTrack()
+        second.append(mido.Message('note_on', channel=1, note=50, time=0))
+        second.append(mido.Message('note_on', channel=1, note=52, time=240))
+        midi.tracks.extend([first, second])
+        midi.save(self.filename)
+        # The first track goes beyond the last step
+        actual = smf.read_sequence(self.filename, step_length=16)
+        self.assertTrue(actual == '1:40 x 52' + ' x' * 61)
+        actual = smf.read_sequence(self.filename, step_length=16, channel=1)
+        self.assertTrue(actual == '1:50 x 52')
+
+    def test_read_sequence_bad_file(self):
+        with open(self.filename, 'wb') as file:
+            file.write(b'MThd\x00\x00')
+        with self.assertRaises(ValueError):
+            smf.read_sequence(self.filename)
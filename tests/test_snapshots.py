@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from microdude import connector
+from microdude.snapshots import SnapshotMemory
+from tests.device import FakeDevice
+from tests.device import create_connector
+
+
+class TestSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.device = FakeDevice()
+        c = create_connector(self.device)
+        self.memory = SnapshotMemory(c)
+        self.memory.capture('A')
+        b = dict(self.memory.snapshots['A'])
+        b[connector.SYNC] = 2
+        b[connector.RX_CHANNEL] = 5
+        self.memory.capture('B', b)
+        self.device.sent = []
+
+    def test_recall_audition(self):
+        delta = self.memory.recall('B')
+        self.assertTrue(delta == {connector.SYNC: 2, connector.RX_CHANNEL: 5})
+        self.assertTrue([m.type for m in self.device.sent] == [
+                        'control_change'] * 2)
+        self.assertTrue(self.device.sent[-1].control ==
+                        connector.CTL_RX_CHANNEL)
+        self.assertTrue(self.device.parameters[connector.SYNC] == 0)
+        self.assertTrue(self.memory.recall('B') == {})
+
+    def test_recall_commit(self):
+        self.memory.recall('B')
+        delta = self.memory.recall('A', True)
+        self.assertTrue(delta == {connector.SYNC: 0, connector.RX_CHANNEL: 0})
+        self.memory.recall('B', True)
+        self.assertTrue(self.device.parameters[connector.SYNC] == 2)
+        self.assertTrue(self.memory.recall('B', True) == {})
+
+    def test_recall_after_external_change(self):
+        self.memory.recall('B')
+        self.memory.connector.set_parameter(connector.SYNC, 0, False)
+        self.assertTrue(self.memory.recall('B') == {connector.SYNC: 2})
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from microdude import transform
+from microdude.steps import StepEditor
+from tests.device import FakeDevice
+from tests.device import create_connector
+
+
+class TestSteps(unittest.TestCase):
+
+    def setUp(self):
+        self.device = FakeDevice()
+        self.device.steps[1][0:3] = [36, 0x7F, 48]
+        c = create_connector(self.device)
+        self.scheduled = []
+        self.editor = StepEditor(
+            c, lambda delay, callback: self.scheduled.append(callback), 0)
+        self.editor.load()
+        self.device.sent = []
+
+    def test_load(self):
+        self.assertTrue(self.editor.get_sequence(1) == '2:36 x 48')
+
+    def test_flush_dirty_fragments(self):
+        self.editor.set_step(1, 0, 40)
+        self.editor.set_step(1, 2, 50)
+        self.editor.set_step(1, 34, 52)
+        self.assertTrue(len(self.scheduled) == 1)
+        self.assertTrue(self.device.sent == [])
+        self.scheduled.pop()()
+        self.assertTrue(len(self.device.sent) == 2)
+        self.assertTrue(self.device.steps[1][0:3] == [40, 0x7F, 50])
+        self.assertTrue(self.device.steps[1][3:35] == [0x7F] * 31 + [52])
+        self.assertTrue(self.editor.flush() == [])
+
+    def test_undo(self):
+        self.editor.set_step(1, 5, 60)
+        self.editor.set_step(1, 0, 38)
+        self.assertTrue(self.editor.undo())
+        self.assertTrue(self.editor.get_sequence(1) == '2:36 x 48 x x 60')
+        self.assertTrue(self.editor.undo())
+        self.assertTrue(self.editor.get_sequence(1) == '2:36 x 48')
+        self.assertFalse(self.editor.undo())
+
+    def test_end(self):
+        self.editor.set_step(1, 1, transform.END)
+        self.assertTrue(self.editor.flush() == [(1, 0)])
+        self.assertTrue(self.device.steps[1][0:3] == [36, 0, 0])
+
+    def test_truncate_and_extend(self):
+        self.editor.set_step(1, 40, 50)
+        self.editor.flush()
+        self.editor.set_step(1, 1, transform.END)
+        self.assertTrue(self.editor.flush() == [(1, 0)])
+        self.editor.set_step(1, 3, 60)
+        self.editor.flush()
+        self.assertTrue(self.editor.get_sequence(1) == '2:36 x x 60')
+        self.assertTrue(self.device.steps[1][0:5] == [36, 0x7F, 0x7F, 60, 0])
+        self.assertTrue(self.editor.undo())
+        self.assertTrue(self.editor.undo())
+        self.assertTrue(self.editor.get_step(1, 40) == 50)
+
+    def test_bad_value(self):
+        with self.assertRaises(ValueError):
+            self.editor.set_step(1, 0, 0x80)
+        with self.assertRaises(ValueError):
+            self.editor.set_step(1, 0, -1)
+
+    def test_end_at_fragment(self):
+        self.editor.set_step(1, 40, 50)
+        self.editor.flush()
+        self.editor.set_step(1, 32, transform.END)
+        self.assertTrue(self.editor.flush() == [(1, 32)])
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from microdude import transform
+
+STEPS = [['36', 'x', '40', '43'], ['60', '62']]
+
+
+class TestTransform(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = transform.from_steps(STEPS)
+
+    def test_fragments(self):
+        fragments = self.bank.to_fragments()
+        self.assertTrue(len(fragments) == 4)
+        self.assertTrue(fragments[0][0:5] == [36, 0x7F, 40, 43, 0])
+        self.assertTrue(fragments[1] == [0] * 0x20)
+        actual = transform.from_fragments(fragments).to_steps()
+        self.assertTrue(actual == STEPS)
+
+    def test_transpose(self):
+        actual = self.bank.transpose(12).to_steps()
+        self.assertTrue(actual == [['48', 'x', '52', '55'], ['72', '74']])
+
+    def test_transpose_limit(self):
+        actual = self.bank.transpose(-100).to_steps()
+        self.assertTrue(actual == [['1', 'x', '1', '1'], ['1', '1']])
+
+    def test_invert(self):
+        actual = self.bank.invert(48).to_steps()
+        self.assertTrue(actual == [['60', 'x', '56', '53'], ['36', '34']])
+
+    def test_reverse(self):
+        actual = self.bank.reverse().to_steps()
+        self.assertTrue(actual == [['43', '40', 'x', '36'], ['62', '60']])
+
+    def test_rotate(self):
+        actual = self.bank.rotate(1).to_steps()
+        self.assertTrue(actual == [['43', '36', 'x', '40'], ['62', '60']])
+
+    def test_quantize(self):
+        actual = self.bank.quantize('major', 2).to_steps()
+        self.assertTrue(actual == [['35', 'x', '40', '43'], ['59', '62']])
+
+    def test_randomize(self):
+        actual = self.bank.copy().randomize(2, seed=1).to_steps()
+        for steps, original in zip(actual, STEPS):
+            for step, note in zip(steps, original):
+                if note == 'x':
+                    self.assertTrue(step == 'x')
+                else:
+                    self.assertTrue(abs(int(step) - int(note)) <= 2)
+
+    def test_randomize_no_probability(self):
+        actual = self.bank.randomize(2, probability=0).to_steps()
+        self.assertTrue(actual == STEPS)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2018 David García Goñi
+#
+# This file is part of MicroDude.
+#
+# MicroDude is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MicroDude is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with MicroDude.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import tempfile
+import unittest
+from microdude import utils
+from microdude.utils import Config
+
+
+class TestConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'config')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def read(self):
+        with open(self.filename, 'r') as file:
+            return json.loads(file.read())
+
+    def test_corrupted_file(self):
+        with open(self.filename, 'w') as file:
+            file.write('{"device": "MicroBrute", ')
+        config = Config(self.filename)
+        self.assertTrue(config[utils.DEVICE] == '')
+        self.assertTrue(config[utils.PERSISTENT] == True)
+
+    def test_old_file(self):
+        with open(self.filename, 'w') as file:
+            file.write('{"device": "MicroBrute", "persistent": false}')
+        config = Config(self.filename)
+        self.assertTrue(config[utils.DEVICE] == 'MicroBrute')
+        self.assertTrue(config.get_device_value(utils.PERSISTENT) == False)
+        self.assertTrue(config[utils.DEVICES] == {})
+
+    def test_debounced_write(self):
+        config = Config(self.filename, 60)
+        config[utils.DEVICE] = 'MicroBrute'
+        config.set_device_value(utils.PERSISTENT, False)
+        self.assertFalse(os.path.exists(self.filename))
+        utils.write_config(config)
+        data = self.read()
+        self.assertTrue(data[utils.DEVICE] == 'MicroBrute')
+        self.assertTrue(data[utils.DEVICES] == {
+                        'MicroBrute': {utils.PERSISTENT: False}})
+        self.assertTrue(os.listdir(self.dir.name) == ['config'])
+
+    def test_device_values(self):
+        config = Config(self.filename, 60)
+        config.set_device_value(utils.BACKEND, 'mido.backends.portmidi', 'A')
+        self.assertTrue(config.get_device_value(
+            utils.BACKEND, 'A') == 'mido.backends.portmidi')
+        self.assertTrue(config.get_device_value(utils.BACKEND, 'B') == '')
+        config.timer.cancel()
+
+    def test_rename_device(self):
+        config = Config(self.filename, 60)
+        config[utils.DEVICE] = 'MicroBrute 24:0'
+        config.set_device_value(utils.PERSISTENT, False)
+        config.rename_device('MicroBrute 24:0', 'MicroBrute')
+        self.assertTrue(config[utils.DEVICE] == 'MicroBrute')
+        self.assertFalse(config.get_device_value(utils.PERSISTENT))
+        self.assertTrue(list(config[utils.DEVICES]) == ['MicroBrute'])
+        config.timer.cancel()